@@ -0,0 +1,23 @@
+"""
+Check that the hot queries use an index.
+
+Creates the indexes of db.INDEX_SPECS, explains the hot queries and exits with a non-zero
+status if any of them would scan the whole collection, so it can gate a deploy or CI run:
+
+    python check_indexes.py
+"""
+import asyncio
+import sys
+import db
+
+async def main():
+    await db.ensure_indexes()
+    report = await db.explain_hot_queries()
+    failed = [name for name, result in report.items() if not result['uses_index']]
+    for name, result in report.items():
+        print(f"{'OK  ' if result['uses_index'] else 'FAIL'} {name}: {' > '.join(result['stages'])}")
+    db.close_db_client()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
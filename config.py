@@ -9,11 +9,130 @@ appENV = os.getenv("APP_ENV", "local")  # Default to 'local' if not set
 QLOO_API_URL = os.getenv("QLOO_API_URL", "https://api.qloo.com/v1/recommendations")
 QLOO_API_KEY = os.getenv("QLOO_API_KEY", "")
 DB_URL = os.getenv("DATABASE_URL")
+DB_MAX_POOL_SIZE = int(os.getenv("DB_MAX_POOL_SIZE", 50))  # Maximum pooled Mongo connections
+DB_MIN_POOL_SIZE = int(os.getenv("DB_MIN_POOL_SIZE", 0))  # Mongo connections kept open while idle
+DB_MAX_IDLE_TIME_MS = int(os.getenv("DB_MAX_IDLE_TIME_MS", 300000))  # Close pooled Mongo connections idle for this long
+DB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("DB_SERVER_SELECTION_TIMEOUT_MS", 5000))  # Fail Mongo operations when no server is reachable for this long
+DB_ENSURE_INDEXES_ON_STARTUP = os.getenv("DB_ENSURE_INDEXES_ON_STARTUP", "true").lower() == "true"  # Create missing indexes when the app starts
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 PORT = int(os.getenv("PORT", 80))  # Default to 80 if not set
 OAI_KEY = os.getenv("OAI_KEY", "")
 
 RECOMMENDATIONS_PER_PAGE = 2
+RECOMMENDATION_COUNTER_ENABLED = os.getenv("RECOMMENDATION_COUNTER_ENABLED", "false").lower() == "true"  # Keep the number of recommendations per query in the session instead of counting them on every page
 # Create a set of all country names (lowercase for matching)
 COUNTRY_NAMES = {country.name.lower() for country in pycountry.countries}
-SHAPEFILE_PATH = os.getenv("SHAPEFILE_PATH", "countries_data")  # Update with your shapefile path
\ No newline at end of file
+SHAPEFILE_PATH = os.getenv("SHAPEFILE_PATH", "countries_data")  # Update with your shapefile path
+
+# Qloo HTTP client settings (shared keep-alive connection pool)
+QLOO_MAX_CONNECTIONS = int(os.getenv("QLOO_MAX_CONNECTIONS", 50))
+QLOO_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("QLOO_MAX_KEEPALIVE_CONNECTIONS", 20))
+QLOO_KEEPALIVE_EXPIRY = float(os.getenv("QLOO_KEEPALIVE_EXPIRY", 30))  # seconds
+QLOO_CONNECT_TIMEOUT = float(os.getenv("QLOO_CONNECT_TIMEOUT", 5))  # seconds
+QLOO_TIMEOUT = float(os.getenv("QLOO_TIMEOUT", 20))  # seconds, read/write/pool
+QLOO_HTTP2 = os.getenv("QLOO_HTTP2", "true").lower() == "true"
+
+# Qloo response cache (in-process LRU with an optional Mongo second tier)
+QLOO_CACHE_ENABLED = os.getenv("QLOO_CACHE_ENABLED", "true").lower() == "true"
+QLOO_CACHE_MAX_ENTRIES = int(os.getenv("QLOO_CACHE_MAX_ENTRIES", 2000))
+QLOO_CACHE_TTL_TAGS = int(os.getenv("QLOO_CACHE_TTL_TAGS", 24 * 60 * 60))  # seconds
+QLOO_CACHE_TTL_SEARCH = int(os.getenv("QLOO_CACHE_TTL_SEARCH", 6 * 60 * 60))  # seconds
+QLOO_CACHE_TTL_INSIGHTS = int(os.getenv("QLOO_CACHE_TTL_INSIGHTS", 6 * 60 * 60))  # seconds
+QLOO_CACHE_MONGO_ENABLED = os.getenv("QLOO_CACHE_MONGO_ENABLED", "false").lower() == "true"
+
+# Local Qloo tag index used to resolve generic terms without a Qloo round trip
+TAG_INDEX_ENABLED = os.getenv("TAG_INDEX_ENABLED", "true").lower() == "true"
+TAG_INDEX_PATH = os.getenv("TAG_INDEX_PATH", "tag_index_data")
+TAG_INDEX_TYPO_CUTOFF = float(os.getenv("TAG_INDEX_TYPO_CUTOFF", 0.85))  # 0-1 similarity for typo-tolerant matches
+TAG_INDEX_MAX_PAGES = int(os.getenv("TAG_INDEX_MAX_PAGES", 200))  # Max pages fetched per entity on refresh
+
+# Backup keyword search fan-out (used when the primary search query returns nothing)
+QLOO_BACKUP_FANOUT_ENABLED = os.getenv("QLOO_BACKUP_FANOUT_ENABLED", "true").lower() == "true"
+QLOO_BACKUP_FANOUT_CONCURRENCY = int(os.getenv("QLOO_BACKUP_FANOUT_CONCURRENCY", 3))
+QLOO_BACKUP_FANOUT_DEADLINE = float(os.getenv("QLOO_BACKUP_FANOUT_DEADLINE", 15))  # seconds
+
+# Speculative prefetch of the next Qloo pages of a query
+QLOO_PREFETCH_ENABLED = os.getenv("QLOO_PREFETCH_ENABLED", "true").lower() == "true"
+QLOO_PREFETCH_DEPTH = int(os.getenv("QLOO_PREFETCH_DEPTH", 1))  # Pages fetched ahead of the current one
+QLOO_PREFETCH_MAX_QUERIES = int(os.getenv("QLOO_PREFETCH_MAX_QUERIES", 200))  # Queries with buffered pages
+QLOO_PREFETCH_TTL = int(os.getenv("QLOO_PREFETCH_TTL", 15 * 60))  # seconds
+
+# Single-flight coalescing of identical in-flight Qloo and LLM calls
+SINGLE_FLIGHT_MAX_TRACKED_KEYS = int(os.getenv("SINGLE_FLIGHT_MAX_TRACKED_KEYS", 1000))  # Keys with per-key metrics
+
+# Cleaned entity descriptions memoized by entity ID
+HTML_CLEAN_MEMO_SIZE = int(os.getenv("HTML_CLEAN_MEMO_SIZE", 5000))
+
+# Qloo pages with at least this many entities are transformed in a process pool (0 disables the pool)
+QLOO_TRANSFORM_PROCESS_POOL_THRESHOLD = int(os.getenv("QLOO_TRANSFORM_PROCESS_POOL_THRESHOLD", 0))
+QLOO_TRANSFORM_PROCESS_POOL_WORKERS = int(os.getenv("QLOO_TRANSFORM_PROCESS_POOL_WORKERS", 2))
+
+# Qloo rate limiting, adaptive (AIMD) concurrency and retries
+QLOO_RATE_LIMIT_RPS = float(os.getenv("QLOO_RATE_LIMIT_RPS", 20))  # Requests started per second (0 disables)
+QLOO_RATE_LIMIT_BURST = int(os.getenv("QLOO_RATE_LIMIT_BURST", 40))
+QLOO_CONCURRENCY_INITIAL = int(os.getenv("QLOO_CONCURRENCY_INITIAL", 10))
+QLOO_CONCURRENCY_MIN = int(os.getenv("QLOO_CONCURRENCY_MIN", 1))
+QLOO_CONCURRENCY_MAX = int(os.getenv("QLOO_CONCURRENCY_MAX", QLOO_MAX_CONNECTIONS))
+QLOO_MAX_RETRIES = int(os.getenv("QLOO_MAX_RETRIES", 3))
+QLOO_RETRY_BUDGET = float(os.getenv("QLOO_RETRY_BUDGET", 10))  # seconds, retries must fit in this budget
+QLOO_RETRY_BASE_DELAY = float(os.getenv("QLOO_RETRY_BASE_DELAY", 0.5))  # seconds
+QLOO_RETRY_MAX_DELAY = float(os.getenv("QLOO_RETRY_MAX_DELAY", 5))  # seconds
+
+# Batched LLM enrichment: score several recommendations per completion
+LLM_BATCH_ENRICHMENT = os.getenv("LLM_BATCH_ENRICHMENT", "true").lower() == "true"
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", 3000))  # Tokens of recommendation data per call
+LLM_BATCH_MAX_SIZE = int(os.getenv("LLM_BATCH_MAX_SIZE", 10))  # Recommendations per call
+
+# Token budget of one recommendation serialized into a scoring prompt
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", 300))
+LLM_PROMPT_TOKEN_BUDGET_PER_CATEGORY = {
+    category.strip(): int(budget)
+    for category, budget in (
+        item.split(":") for item in os.getenv("LLM_PROMPT_TOKEN_BUDGET_PER_CATEGORY", "movies:300,tv_shows:300,books:300,places:350").split(",") if ":" in item
+    )
+}
+LLM_PROMPT_STATS_SAMPLE_RATE = float(os.getenv("LLM_PROMPT_STATS_SAMPLE_RATE", 0.05))  # Share of serialized recommendations whose original size is measured for /metrics, 0 disables
+
+# Streamed score-first enrichment, one call per recommendation stopped early on failing scores (takes precedence over batching)
+LLM_STREAMING_ENRICHMENT = os.getenv("LLM_STREAMING_ENRICHMENT", "false").lower() == "true"
+
+# Async OpenAI client
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))  # LLM calls in flight per model
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))  # seconds per call
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))  # seconds
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+
+# Cross-session cache of message decomposition results
+DECOMPOSITION_CACHE_ENABLED = os.getenv("DECOMPOSITION_CACHE_ENABLED", "true").lower() == "true"
+DECOMPOSITION_CACHE_MAX_ENTRIES = int(os.getenv("DECOMPOSITION_CACHE_MAX_ENTRIES", 5000))
+DECOMPOSITION_CACHE_TTL = int(os.getenv("DECOMPOSITION_CACHE_TTL", 7 * 24 * 60 * 60))  # seconds
+DECOMPOSITION_CACHE_MONGO_ENABLED = os.getenv("DECOMPOSITION_CACHE_MONGO_ENABLED", "true").lower() == "true"
+
+# Near-duplicate message index in front of the LLM decomposition
+QUERY_INDEX_ENABLED = os.getenv("QUERY_INDEX_ENABLED", "true").lower() == "true"
+QUERY_INDEX_PATH = os.getenv("QUERY_INDEX_PATH", "query_index_data")
+QUERY_INDEX_THRESHOLD = float(os.getenv("QUERY_INDEX_THRESHOLD", 0.85))  # Cosine similarity to reuse a decomposition
+QUERY_INDEX_DIMENSIONS = int(os.getenv("QUERY_INDEX_DIMENSIONS", 1024))  # Hashed n-gram vector size
+QUERY_INDEX_MAX_ENTRIES = int(os.getenv("QUERY_INDEX_MAX_ENTRIES", 10000))  # Messages kept per category
+
+# Cache of the LLM context and score of a recommendation per intent
+ENRICHMENT_CACHE_ENABLED = os.getenv("ENRICHMENT_CACHE_ENABLED", "true").lower() == "true"
+ENRICHMENT_CACHE_MAX_ENTRIES = int(os.getenv("ENRICHMENT_CACHE_MAX_ENTRIES", 20000))
+ENRICHMENT_CACHE_TTL = int(os.getenv("ENRICHMENT_CACHE_TTL", 7 * 24 * 60 * 60))  # seconds
+ENRICHMENT_CACHE_MONGO_ENABLED = os.getenv("ENRICHMENT_CACHE_MONGO_ENABLED", "true").lower() == "true"
+ENRICHMENT_CACHE_WARM_ON_STARTUP = os.getenv("ENRICHMENT_CACHE_WARM_ON_STARTUP", "false").lower() == "true"
+
+# Local pre-ranking of a Qloo page before LLM scoring
+PRE_RANK_ENABLED = os.getenv("PRE_RANK_ENABLED", "true").lower() == "true"
+PRE_RANK_TOP_K = int(os.getenv("PRE_RANK_TOP_K", 10))  # Candidates scored by the LLM per page (0 keeps all)
+PRE_RANK_TOP_K_PER_CATEGORY = {
+    category.strip(): int(top_k)
+    for category, top_k in (
+        item.split(":") for item in os.getenv("PRE_RANK_TOP_K_PER_CATEGORY", "movies:10,tv_shows:10,books:10,places:8").split(",") if ":" in item
+    )
+}
+PRE_RANK_DEFAULT_RADIUS = float(os.getenv("PRE_RANK_DEFAULT_RADIUS", 50))  # km, when the location has no max radius
+
+# LLM call telemetry
+LLM_TELEMETRY_RECENT_REQUESTS = int(os.getenv("LLM_TELEMETRY_RECENT_REQUESTS", 50))  # Request summaries kept for /metrics
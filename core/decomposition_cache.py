@@ -0,0 +1,145 @@
+from config import (
+    DECOMPOSITION_CACHE_ENABLED, DECOMPOSITION_CACHE_MAX_ENTRIES, DECOMPOSITION_CACHE_TTL,
+    DECOMPOSITION_CACHE_MONGO_ENABLED
+)
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import asyncio
+import copy
+import hashlib
+import json
+import time
+import db
+from utils import clean_text
+
+# In-process LRU: cache_key -> (expires_at monotonic time, decomposition result)
+_cache = OrderedDict()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "mongo_hits": 0,
+    "expired": 0,
+    "evictions": 0,
+}
+
+def get_prompt_version(sys_prompt):
+    """
+    Get the version of a decomposition system prompt.
+
+    The version is a hash of the formatted prompt, so editing MESSAGE_DECOMPOSITION_PROMPT
+    (or the category explanations formatted into it) moves every lookup to new keys and
+    the results of the old prompt are never served again.
+
+    Args:
+        sys_prompt (str): The formatted system prompt.
+
+    Returns:
+        str: The prompt version.
+    """
+    return hashlib.sha1(sys_prompt.encode("utf-8")).hexdigest()[:16]
+
+def get_cache_key(user_message, recommendation_category, prompt_version):
+    """
+    Build the cache key of a message decomposition.
+
+    Args:
+        user_message (str): The user's message.
+        recommendation_category (str): The category of recommendations.
+        prompt_version (str): The version from get_prompt_version.
+
+    Returns:
+        str or None: The cache key, None if caching is disabled or the message is empty.
+    """
+    if not DECOMPOSITION_CACHE_ENABLED:
+        return None
+    cleaned_message = clean_text(user_message)
+    if not cleaned_message:
+        return None
+    return f"{prompt_version}:{recommendation_category}:{cleaned_message}"
+
+def _store_in_memory(cache_key, data, expires_at):
+    _cache[cache_key] = (expires_at, data)
+    _cache.move_to_end(cache_key)
+    while len(_cache) > DECOMPOSITION_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+async def get_cached_decomposition(cache_key):
+    """
+    Get a cached message decomposition, checking the in-process LRU first and then Mongo if enabled.
+
+    Callers add fields such as the location details to the result, so a copy is returned.
+
+    Args:
+        cache_key (str): The cache key from get_cache_key.
+
+    Returns:
+        dict or None: A copy of the cached decomposition if found and fresh, otherwise None.
+    """
+    entry = _cache.get(cache_key)
+    if entry is not None:
+        expires_at, data = entry
+        if expires_at > time.monotonic():
+            _cache.move_to_end(cache_key)
+            _stats["hits"] += 1
+            return copy.deepcopy(data)
+        del _cache[cache_key]
+        _stats["expired"] += 1
+
+    if DECOMPOSITION_CACHE_MONGO_ENABLED:
+        try:
+            cached = await db.get_cached_decomposition(cache_key)
+        except Exception as e:
+            print(f"Error reading decomposition cache from database: {e}")
+            cached = None
+        if cached is not None:
+            serialized, expires_at = cached
+            data = json.loads(serialized)
+            remaining = (expires_at - datetime.utcnow()).total_seconds()
+            _store_in_memory(cache_key, data, time.monotonic() + remaining)
+            _stats["hits"] += 1
+            _stats["mongo_hits"] += 1
+            return copy.deepcopy(data)
+
+    _stats["misses"] += 1
+    return None
+
+async def set_cached_decomposition(cache_key, data):
+    """
+    Cache a message decomposition in the in-process LRU and, if enabled, in Mongo.
+
+    Args:
+        cache_key (str): The cache key from get_cache_key.
+        data (dict): The decomposition result.
+
+    Returns:
+        None
+    """
+    if DECOMPOSITION_CACHE_TTL <= 0:
+        return
+    data = copy.deepcopy(data)
+    _store_in_memory(cache_key, data, time.monotonic() + DECOMPOSITION_CACHE_TTL)
+
+    if DECOMPOSITION_CACHE_MONGO_ENABLED:
+        # Writing to the shared tier should not hold up the response
+        asyncio.create_task(db.set_cached_decomposition(
+            cache_key,
+            json.dumps(data),
+            datetime.utcnow() + timedelta(seconds=DECOMPOSITION_CACHE_TTL)
+        ))
+
+def get_cache_stats():
+    """
+    Get the decomposition cache hit/miss counters.
+
+    Returns:
+        dict: The counters along with the current size and hit rate.
+    """
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_cache),
+        "max_size": DECOMPOSITION_CACHE_MAX_ENTRIES,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
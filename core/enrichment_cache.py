@@ -0,0 +1,173 @@
+from config import (
+    ENRICHMENT_CACHE_ENABLED, ENRICHMENT_CACHE_MAX_ENTRIES, ENRICHMENT_CACHE_TTL,
+    ENRICHMENT_CACHE_MONGO_ENABLED, ENRICHMENT_CACHE_WARM_ON_STARTUP
+)
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import time
+import db
+from core import llm_core, prompts
+from utils import clean_text
+
+# Version of the scoring prompts and of the recommendations serialized into them, a change to any of them invalidates every cached score
+PROMPT_VERSION = hashlib.sha1("\x00".join((
+    prompts.RECOMMENDATION_CONTEXT_PROMPT,
+    prompts.BATCH_RECOMMENDATION_CONTEXT_PROMPT,
+    prompts.STREAMING_RECOMMENDATION_CONTEXT_PROMPT,
+    llm_core.PROMPT_SERIALIZATION_VERSION,
+)).encode("utf-8")).hexdigest()[:16]
+
+# In-process LRU: cache_key -> (expires_at monotonic time, {'context', 'score'})
+_cache = OrderedDict()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "mongo_hits": 0,
+    "expired": 0,
+    "evictions": 0,
+    "warmed": 0,
+}
+
+def get_cache_key(entity_id, user_query=None, tag_id=None, original_query=None):
+    """
+    Build the cache key of the context and score of a recommendation for an intent.
+
+    The intent is the normalized user query or, for tag based recommendations, the tag ID
+    along with the message that was converted to it.
+
+    Args:
+        entity_id (str): The Qloo entity ID of the recommendation.
+        user_query (str, optional): The user's query the recommendation is scored against.
+        tag_id (str, optional): The tag ID, used when there is no user query.
+        original_query (str, optional): The user's message when it was converted to a tag.
+
+    Returns:
+        str or None: The cache key, None if caching is disabled or there is no entity ID or intent.
+    """
+    if not ENRICHMENT_CACHE_ENABLED or not entity_id:
+        return None
+    if user_query:
+        intent = f"query:{clean_text(user_query)}"
+    elif tag_id:
+        intent = f"tag:{tag_id}:{clean_text(original_query or '')}"
+    else:
+        return None
+    return hashlib.sha1(f"{PROMPT_VERSION}\x00{entity_id}\x00{intent}".encode("utf-8")).hexdigest()
+
+def _store_in_memory(cache_key, data, expires_at):
+    _cache[cache_key] = (expires_at, data)
+    _cache.move_to_end(cache_key)
+    while len(_cache) > ENRICHMENT_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+async def get_cached_enrichments(cache_keys):
+    """
+    Get the cached context and score of many recommendations, checking the in-process LRU
+    first and then Mongo, in one query, if enabled.
+
+    Args:
+        cache_keys (list): The cache keys from get_cache_key.
+
+    Returns:
+        dict: cache_key -> {'context', 'score'} for the keys found and fresh.
+    """
+    found = {}
+    remaining = []
+    now = time.monotonic()
+    for cache_key in cache_keys:
+        entry = _cache.get(cache_key)
+        if entry is not None:
+            expires_at, data = entry
+            if expires_at > now:
+                _cache.move_to_end(cache_key)
+                found[cache_key] = dict(data)
+                continue
+            del _cache[cache_key]
+            _stats["expired"] += 1
+        remaining.append(cache_key)
+
+    if remaining and ENRICHMENT_CACHE_MONGO_ENABLED:
+        try:
+            cached = await db.get_cached_enrichments(remaining)
+        except Exception as e:
+            print(f"Error reading enrichment cache from database: {e}")
+            cached = {}
+        for cache_key, (data, expires_at) in cached.items():
+            remaining_ttl = (expires_at - datetime.utcnow()).total_seconds()
+            _store_in_memory(cache_key, data, time.monotonic() + remaining_ttl)
+            found[cache_key] = dict(data)
+            _stats["mongo_hits"] += 1
+
+    _stats["hits"] += len(found)
+    _stats["misses"] += len(cache_keys) - len(found)
+    return found
+
+async def set_cached_enrichments(contexts_and_scores):
+    """
+    Cache the context and score of recommendations in the in-process LRU and, if enabled, in Mongo.
+
+    Args:
+        contexts_and_scores (dict): cache_key -> {'context', 'score'}.
+
+    Returns:
+        None
+    """
+    if not contexts_and_scores or ENRICHMENT_CACHE_TTL <= 0:
+        return
+    entries = {
+        cache_key: {'context': data.get('context'), 'score': data.get('score')}
+        for cache_key, data in contexts_and_scores.items()
+    }
+    expires_at = time.monotonic() + ENRICHMENT_CACHE_TTL
+    for cache_key, data in entries.items():
+        _store_in_memory(cache_key, data, expires_at)
+
+    if ENRICHMENT_CACHE_MONGO_ENABLED:
+        # Writing to the shared tier should not hold up saving the recommendations
+        asyncio.create_task(db.set_cached_enrichments(
+            entries,
+            PROMPT_VERSION,
+            datetime.utcnow() + timedelta(seconds=ENRICHMENT_CACHE_TTL)
+        ))
+
+async def warm_enrichment_cache():
+    """
+    Load the most recently cached scores of the current prompt version from Mongo into the in-process LRU.
+
+    Returns:
+        int: The number of entries loaded.
+    """
+    if not (ENRICHMENT_CACHE_ENABLED and ENRICHMENT_CACHE_MONGO_ENABLED and ENRICHMENT_CACHE_WARM_ON_STARTUP):
+        return 0
+    try:
+        cached = await db.get_recent_cached_enrichments(PROMPT_VERSION, ENRICHMENT_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        print(f"Error warming enrichment cache from database: {e}")
+        return 0
+    now = datetime.utcnow()
+    # Oldest first, so the most recent entries end up as the most recently used
+    for cache_key, (data, expires_at) in reversed(list(cached.items())):
+        _store_in_memory(cache_key, data, time.monotonic() + (expires_at - now).total_seconds())
+    _stats["warmed"] += len(cached)
+    print(f"Enrichment cache warmed with {len(cached)} entries")
+    return len(cached)
+
+def get_cache_stats():
+    """
+    Get the enrichment cache hit/miss counters.
+
+    Returns:
+        dict: The counters along with the current size and hit rate.
+    """
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_cache),
+        "max_size": ENRICHMENT_CACHE_MAX_ENTRIES,
+        "prompt_version": PROMPT_VERSION,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
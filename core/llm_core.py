@@ -1,21 +1,91 @@
-from config import OAI_KEY
+from config import (
+    OAI_KEY, LLM_BATCH_TOKEN_BUDGET, LLM_BATCH_MAX_SIZE, LLM_PROMPT_TOKEN_BUDGET, LLM_PROMPT_TOKEN_BUDGET_PER_CATEGORY,
+    LLM_PROMPT_STATS_SAMPLE_RATE, LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_MAX_CONNECTIONS, LLM_MAX_RETRIES
+)
 import openai
-from core import prompts
-from utils import extract_dictionary_from_string
+import asyncio
+import hashlib
+import httpx
+import json
+import random
+import re
+import tiktoken
+import time
+from core import prompts, decomposition_cache, query_index, llm_telemetry
+from core.single_flight import SingleFlight
+from utils import extract_dictionary_from_string, extract_list_from_string, JSONScanner
 
-# Initialize OpenAI client with the API key
-llm_model = openai.OpenAI(
-    api_key=OAI_KEY,
-)
+LLM_MODEL_NAME = "gpt-4o-mini"
+
+# Async OpenAI client, created on first use so it binds to the running event loop
+llm_model = None
+
+# Per-model semaphores bounding the LLM calls in flight
+_llm_semaphores = {}
+
+# Identical prompts in flight at the same time share one LLM call
+llm_single_flight = SingleFlight("llm")
+
+# Recommendations must score above this to be saved
+MIN_PASSING_SCORE = 5
+
+# Leading score of a streamed scoring response, only matched once a character follows the number
+STREAMED_SCORE_PATTERN = re.compile(r'"score"\s*:\s*"?(\d+(?:\.\d+)?)(?=[^\d.])')
+
+_streaming_stats = {
+    "streams": 0,
+    "aborted": 0,
+    "completed": 0,
+    "failed": 0,
+}
+
+def get_llm_client():
+    """
+    Get the shared async OpenAI client, creating it on first use.
+
+    The client keeps a pool of connections to the OpenAI API that every LLM call reuses.
 
-def get_llm_response(sys_prompt, user_prompt=None):
+    Returns:
+        openai.AsyncOpenAI: The shared client.
+    """
+    global llm_model
+    if llm_model is None:
+        llm_model = openai.AsyncOpenAI(
+            api_key=OAI_KEY,
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            max_retries=LLM_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            ),
+        )
+    return llm_model
+
+async def close_llm_client():
+    """
+    Close the shared OpenAI client and its pooled connections.
+    """
+    global llm_model
+    if llm_model is not None:
+        await llm_model.close()
+        llm_model = None
+
+def _get_llm_semaphore(model_name):
+    semaphore = _llm_semaphores.get(model_name)
+    if semaphore is None:
+        semaphore = _llm_semaphores[model_name] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return semaphore
+
+async def get_llm_response(sys_prompt, user_prompt=None, model_name=LLM_MODEL_NAME, timeout=None, prompt_type=None):
     """
     Get a response from the LLM based on the system and user prompts.
     
     Args:
         sys_prompt (str): The system prompt to guide the LLM.
         user_prompt (str): The user's input prompt.
-        max_tokens (int): The maximum number of tokens for the response.
+        model_name (str): The model to use.
+        timeout (float, optional): Timeout in seconds for this call, LLM_TIMEOUT if not given.
+        prompt_type (str, optional): The prompt type the call is recorded under in the telemetry.
     
     Returns:
         str: The LLM's response.
@@ -25,13 +95,34 @@ def get_llm_response(sys_prompt, user_prompt=None):
     ]
     if user_prompt:
         messages.append({"role": "user", "content": user_prompt})
+    prompt_type = prompt_type or "other"
+    started_at = None
     try:
-        response = llm_model.chat.completions.create(
-            messages=messages,
-            model="gpt-4o-mini",
+        async with _get_llm_semaphore(model_name):
+            started_at = time.monotonic()
+            raw_response = await get_llm_client().chat.completions.with_raw_response.create(
+                messages=messages,
+                model=model_name,
+                timeout=timeout if timeout is not None else LLM_TIMEOUT,
+            )
+            response = raw_response.parse()
+        usage = response.usage
+        llm_telemetry.record_llm_call(
+            prompt_type,
+            model_name,
+            time.monotonic() - started_at,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            retries=getattr(raw_response, "retries_taken", 0),
         )
         return response.choices[0].message.content.strip()
     except Exception as e:
+        llm_telemetry.record_llm_call(
+            prompt_type,
+            model_name,
+            time.monotonic() - started_at if started_at is not None else 0.0,
+            error=e,
+        )
         print(f"Error getting LLM response: {e}")
         if "insufficient" in str(e).lower():
             return "Error: Insufficient permissions to access the LLM. Please check your API key and permissions."
@@ -40,6 +131,44 @@ def get_llm_response(sys_prompt, user_prompt=None):
         else:
             print(f"Unexpected error: {e}")
             return None
+
+async def get_shared_llm_response(sys_prompt, user_prompt=None, prompt_type=None):
+    """
+    Get a response from the LLM, sharing the call with any identical prompt already in flight.
+
+    Args:
+        sys_prompt (str): The system prompt to guide the LLM.
+        user_prompt (str): The user's input prompt.
+        prompt_type (str, optional): The prompt type the call is recorded under in the telemetry.
+
+    Returns:
+        str: The LLM's response.
+    """
+    key = hashlib.sha1(f"{LLM_MODEL_NAME}\x00{sys_prompt}\x00{user_prompt or ''}".encode("utf-8")).hexdigest()
+    return await _run_shared_llm_call(key, get_llm_response, sys_prompt, user_prompt, prompt_type=prompt_type)
+
+async def _run_shared_llm_call(key, coroutine_function, *args, **kwargs):
+    # The shared call is recorded once in the aggregate metrics, and in the summary of every request that waited on it
+    shared = llm_single_flight.is_in_flight(key)
+    result, captured = await llm_single_flight.run(key, _capture_llm_calls_of, coroutine_function, *args, **kwargs)
+    llm_telemetry.record_captured_calls(captured, shared=shared)
+    return result
+
+async def _capture_llm_calls_of(coroutine_function, *args, **kwargs):
+    captured = llm_telemetry.capture_llm_calls()
+    return await coroutine_function(*args, **kwargs), captured
+
+def get_llm_concurrency_stats():
+    """
+    Get the LLM concurrency limit and free slots, per model.
+
+    Returns:
+        dict: model -> {'limit', 'available'}.
+    """
+    return {
+        model_name: {"limit": LLM_MAX_CONCURRENCY, "available": semaphore._value}
+        for model_name, semaphore in _llm_semaphores.items()
+    }
     
 async def get_system_prompt_for_user_message(selected_recommendation_category, all_possible_recommendation_categories=None):
     """
@@ -75,7 +204,22 @@ async def get_recommendation_data_from_user_message(user_message, selected_recom
         all_possible_recommendation_categories=all_possible_recommendation_categories
     )
     
-    llm_response = get_llm_response(sys_prompt, user_message)
+    # Identical asks in the same category are decomposed the same way across sessions
+    prompt_version = decomposition_cache.get_prompt_version(sys_prompt)
+    cache_key = decomposition_cache.get_cache_key(user_message, selected_recommendation_category, prompt_version)
+    if cache_key:
+        cached = await decomposition_cache.get_cached_decomposition(cache_key)
+        if cached is not None:
+            return cached
+
+    # Near-duplicate asks ("good horror movies" vs "some good horror movie recs") can reuse a stored decomposition
+    similar = query_index.find_similar_decomposition(selected_recommendation_category, prompt_version, user_message)
+    if similar is not None:
+        if cache_key:
+            await decomposition_cache.set_cached_decomposition(cache_key, similar)
+        return similar
+
+    llm_response = await get_shared_llm_response(sys_prompt, user_message, prompt_type=llm_telemetry.DECOMPOSITION)
     
     if llm_response:
         # Extract the dictionary from the LLM response
@@ -85,34 +229,495 @@ async def get_recommendation_data_from_user_message(user_message, selected_recom
         
         recommendation_data = extract_dictionary_from_string(llm_response)
         if recommendation_data:
+            if cache_key:
+                await decomposition_cache.set_cached_decomposition(cache_key, recommendation_data)
+            if recommendation_data.get('is_valid', False):
+                query_index.add_decomposition(selected_recommendation_category, prompt_version, user_message, recommendation_data)
             return recommendation_data
         else:
+            llm_telemetry.record_parse_failure(llm_telemetry.DECOMPOSITION, LLM_MODEL_NAME)
             print("No valid recommendation data found in the LLM response.")
 
-def get_context_and_score_for_recommndation_text(recommendation, user_message=None):
+async def get_context_and_score_for_recommndation_text(recommendation, user_message=None, recommendation_category=None):
     """
     Get the context for the recommendation text.
     
     Args:
         recommendation (dict): The recommendation data.
         user_message (str, optional): The user's message to include in the context.
+        recommendation_category (str, optional): The category of recommendations, used to pick the prompt token budget.
     
     Returns:
         str: The context for the recommendation text.
     """
 
     sys_prompt = prompts.RECOMMENDATION_CONTEXT_PROMPT.format(
-        recommendation=recommendation,
+        recommendation=_to_json(serialize_recommendation_for_prompt(recommendation, recommendation_category)),
         user_message=user_message if user_message else "No user message provided."
     )
 
-    llm_response = get_llm_response(sys_prompt)
+    llm_response = await get_shared_llm_response(sys_prompt, prompt_type=llm_telemetry.CONTEXT)
     score_context_data = extract_dictionary_from_string(llm_response)
     
     if score_context_data:
         return score_context_data
     else:
+        if llm_response:
+            llm_telemetry.record_parse_failure(llm_telemetry.CONTEXT, LLM_MODEL_NAME)
         print("No valid context data found in the LLM response.")
         return None
 
-    
\ No newline at end of file
+# Seconds to wait before loading the tokenizer again after a failure
+TOKEN_ENCODING_RETRY_INTERVAL = 60
+
+_token_encoding = None
+_token_encoding_loading = False
+_token_encoding_retry_at = 0.0
+
+def _load_token_encoding():
+    try:
+        return tiktoken.encoding_for_model(LLM_MODEL_NAME)
+    except KeyError:
+        # Model unknown to this tiktoken version
+        return tiktoken.get_encoding("o200k_base")
+
+async def load_token_encoding():
+    """
+    Load the tokenizer of the LLM model off the event loop.
+
+    The first load may download the BPE file, so it is done at startup and, after a
+    failure, retried in the background while token counts are estimated.
+
+    Returns:
+        tiktoken.Encoding or None: The tokenizer, None if it could not be loaded.
+    """
+    global _token_encoding, _token_encoding_loading, _token_encoding_retry_at
+    if _token_encoding is not None or _token_encoding_loading:
+        return _token_encoding
+    _token_encoding_loading = True
+    try:
+        _token_encoding = await asyncio.to_thread(_load_token_encoding)
+    except Exception as e:
+        print(f"Error loading tokenizer, estimating token counts and retrying in {TOKEN_ENCODING_RETRY_INTERVAL}s: {e}")
+        _token_encoding_retry_at = time.monotonic() + TOKEN_ENCODING_RETRY_INTERVAL
+    finally:
+        _token_encoding_loading = False
+    return _token_encoding
+
+def _get_token_encoding():
+    """
+    Get the tokenizer of the LLM model without blocking the event loop.
+
+    While it is not loaded, a background load is started (at most once per retry
+    interval) and None is returned so callers estimate.
+
+    Returns:
+        tiktoken.Encoding or None: The tokenizer, None if it is not loaded yet.
+    """
+    global _token_encoding, _token_encoding_retry_at
+    if _token_encoding is None and not _token_encoding_loading and time.monotonic() >= _token_encoding_retry_at:
+        try:
+            asyncio.get_running_loop().create_task(load_token_encoding())
+        except RuntimeError:
+            # No event loop (e.g. a script), nothing to block
+            try:
+                _token_encoding = _load_token_encoding()
+            except Exception as e:
+                print(f"Error loading tokenizer, estimating token counts: {e}")
+                _token_encoding_retry_at = time.monotonic() + TOKEN_ENCODING_RETRY_INTERVAL
+    return _token_encoding
+
+def count_tokens(text):
+    """
+    Count the tokens of a text for the LLM model, estimating from its length if no tokenizer is available.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Truncate a text to at most `max_tokens` tokens, marking the cut with an ellipsis.
+
+    Args:
+        text (str): The text.
+        max_tokens (int): The maximum number of tokens.
+
+    Returns:
+        str: The text, truncated if it was longer.
+    """
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_token_encoding()
+    if encoding is None:
+        return text if len(text) <= max_tokens * 4 else text[:max_tokens * 4].rstrip() + "..."
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + "..."
+
+# Recommendation fields sent to the LLM, most important first
+PROMPT_FIELDS = ('title', 'genre', 'author', 'release_date', 'publication_date', 'address')
+
+# extra_data keys worth their tokens, most important first; other keys follow and are dropped first
+PROMPT_EXTRA_DATA_PRIORITY = (
+    'popularity', 'business_rating', 'price_level', 'price_range', 'hotel_class', 'is_closed',
+    'where_to_watch', 'publisher', 'page_count',
+)
+
+# extra_data keys that are bulky and add little to judging the fit of a recommendation
+PROMPT_EXCLUDED_EXTRA_DATA = ('hours', 'location', 'keywords', 'website', 'phone', 'number_of_rooms')
+
+PROMPT_MAX_TAGS = 15
+
+# Bump when serialize_recommendation_for_prompt changes what it sends, cached scores of the old format are then not served
+PROMPT_SERIALIZER_VERSION = 1
+
+# Version of the serialized recommendations, including the settings that shape them
+PROMPT_SERIALIZATION_VERSION = hashlib.sha1(json.dumps([
+    PROMPT_SERIALIZER_VERSION, PROMPT_FIELDS, PROMPT_EXTRA_DATA_PRIORITY, PROMPT_EXCLUDED_EXTRA_DATA, PROMPT_MAX_TAGS,
+    LLM_PROMPT_TOKEN_BUDGET, sorted(LLM_PROMPT_TOKEN_BUDGET_PER_CATEGORY.items()),
+]).encode("utf-8")).hexdigest()[:16]
+
+_serialization_stats = {
+    "recommendations": 0,
+    # Token counts of the sampled recommendations, before and after serialization
+    "sampled": 0,
+    "original_tokens": 0,
+    "serialized_tokens": 0,
+    "truncated_descriptions": 0,
+    "over_budget": 0,
+}
+
+def get_prompt_token_budget(recommendation_category):
+    """
+    Get the token budget of one serialized recommendation of a category.
+
+    Args:
+        recommendation_category (str): The category of recommendations.
+
+    Returns:
+        int: The token budget.
+    """
+    return LLM_PROMPT_TOKEN_BUDGET_PER_CATEGORY.get(recommendation_category, LLM_PROMPT_TOKEN_BUDGET)
+
+def _compact_extra_data(extra_data):
+    compacted = {}
+    ordered_keys = [key for key in PROMPT_EXTRA_DATA_PRIORITY if key in extra_data]
+    ordered_keys += [key for key in extra_data if key not in PROMPT_EXTRA_DATA_PRIORITY]
+    for key in ordered_keys:
+        value = extra_data[key]
+        if key in PROMPT_EXCLUDED_EXTRA_DATA or value is None or value == '' or value == [] or value == {}:
+            continue
+        if isinstance(value, dict):
+            # External sources carry nested blobs, only their plain values (e.g. ratings) are kept
+            value = {k: v for k, v in value.items() if isinstance(v, (str, int, float, bool)) and v != ''}
+            if not value:
+                continue
+        compacted[key] = value
+    return compacted
+
+def _to_json(data):
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+def serialize_recommendation_for_prompt(recommendation, recommendation_category=None):
+    """
+    Get a compact version of a recommendation's prompt data that fits the token budget of its category.
+
+    Fields are kept by priority: the identifying fields, then tag names, then the useful
+    extra data, with the description truncated by tokens to whatever budget is left. If
+    even that does not fit, extra data and then tags are dropped, least important first.
+    Images and bulky extra data (hours, coordinates, keywords) are never sent.
+
+    Args:
+        recommendation (dict): The recommendation prompt data.
+        recommendation_category (str, optional): The category of recommendations, used to pick the budget.
+
+    Returns:
+        dict: The serialized recommendation.
+    """
+    budget = get_prompt_token_budget(recommendation_category)
+    serialized = {field: recommendation[field] for field in PROMPT_FIELDS if recommendation.get(field)}
+    tag_names = [tag.get('name') for tag in recommendation.get('tags') or [] if tag.get('name')][:PROMPT_MAX_TAGS]
+    extra_data = _compact_extra_data(recommendation.get('extra_data') or {})
+
+    def build(description=None):
+        data = dict(serialized)
+        if description:
+            data['description'] = description
+        if tag_names:
+            data['tags'] = tag_names
+        if extra_data:
+            data['extra_data'] = extra_data
+        return data
+
+    tokens = count_tokens(_to_json(build()))
+    while tokens > budget and (extra_data or tag_names):
+        if extra_data:
+            extra_data.popitem()
+        else:
+            tag_names.pop()
+        tokens = count_tokens(_to_json(build()))
+
+    description = recommendation.get('description') or ''
+    if description:
+        # Leave room for the key and quotes around the description
+        truncated = truncate_to_tokens(description, budget - tokens - 6)
+        if truncated != description:
+            _serialization_stats["truncated_descriptions"] += 1
+        description = truncated
+
+    result = build(description)
+    serialized_tokens = count_tokens(_to_json(result))
+    _serialization_stats["recommendations"] += 1
+    if LLM_PROMPT_STATS_SAMPLE_RATE > 0 and random.random() < LLM_PROMPT_STATS_SAMPLE_RATE:
+        # Tokenizing the whole recommendation is only for the metrics, so only a sample is measured
+        _serialization_stats["sampled"] += 1
+        _serialization_stats["original_tokens"] += count_tokens(str(recommendation))
+        _serialization_stats["serialized_tokens"] += serialized_tokens
+    if serialized_tokens > budget:
+        _serialization_stats["over_budget"] += 1
+    return result
+
+def get_prompt_serialization_stats():
+    """
+    Get the token savings of the recommendation prompt serialization.
+
+    Returns:
+        dict: The token counts before and after serialization of the sampled recommendations and the tokens saved.
+    """
+    saved = _serialization_stats["original_tokens"] - _serialization_stats["serialized_tokens"]
+    return {
+        **_serialization_stats,
+        "saved_tokens": saved,
+        "saved_ratio": round(saved / _serialization_stats["original_tokens"], 4) if _serialization_stats["original_tokens"] else 0.0,
+    }
+
+def _parse_batch_item(item, expected_refs):
+    """
+    Validate one item of a batch scoring response.
+
+    Returns:
+        tuple or None: (ref, {'context', 'score'}) if the item is valid, otherwise None.
+    """
+    if not isinstance(item, dict):
+        return None
+    ref = str(item.get('ref', ''))
+    context = item.get('context')
+    if ref not in expected_refs or not isinstance(context, str) or not context.strip():
+        return None
+    try:
+        score = int(item.get('score'))
+    except (TypeError, ValueError):
+        return None
+    if score < 1 or score > 10:
+        return None
+    return ref, {'context': context, 'score': score}
+
+async def _get_context_and_score_for_batch(batch, user_message=None):
+    """
+    Score one batch of serialized recommendations in a single LLM call.
+
+    Args:
+        batch (list): (ref, serialized recommendation) pairs.
+        user_message (str, optional): The user's message.
+
+    Returns:
+        dict: ref -> {'context', 'score'} for the items the LLM returned valid results for.
+    """
+    expected_refs = {ref for ref, _ in batch}
+    sys_prompt = prompts.BATCH_RECOMMENDATION_CONTEXT_PROMPT.format(
+        recommendations=_to_json([{'ref': ref, **serialized} for ref, serialized in batch]),
+        user_message=user_message if user_message else "No user message provided."
+    )
+    llm_response = await get_shared_llm_response(sys_prompt, prompt_type=llm_telemetry.CONTEXT_BATCH)
+    if not llm_response or llm_response.startswith("Error"):
+        return {}
+
+    items = extract_list_from_string(llm_response)
+    if items is None:
+        llm_telemetry.record_parse_failure(llm_telemetry.CONTEXT_BATCH, LLM_MODEL_NAME)
+        print("No valid batch context data found in the LLM response.")
+        return {}
+
+    results = {}
+    for item in items:
+        parsed = _parse_batch_item(item, expected_refs)
+        if parsed is not None and parsed[0] not in results:
+            results[parsed[0]] = parsed[1]
+    return results
+
+async def get_context_and_score_for_recommendations_batched(recommendations, user_message=None, recommendation_category=None):
+    """
+    Get the context and score for many recommendations, several per LLM call.
+
+    Recommendations are serialized within their token budget and packed into batches of up to LLM_BATCH_MAX_SIZE items
+    whose serialized data fits in LLM_BATCH_TOKEN_BUDGET tokens, so the batch size adapts to
+    how large the recommendations are. Items missing or malformed in a batch response are
+    scored again one at a time.
+
+    Args:
+        recommendations (list): The recommendations' prompt data.
+        user_message (str, optional): The user's message to include in the context.
+        recommendation_category (str, optional): The category of recommendations, used to pick the prompt token budget.
+
+    Returns:
+        list: {'context', 'score'} or None for each recommendation, in input order.
+    """
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for index, recommendation in enumerate(recommendations):
+        serialized = serialize_recommendation_for_prompt(recommendation, recommendation_category)
+        tokens = count_tokens(_to_json(serialized))
+        if batch and (len(batch) >= LLM_BATCH_MAX_SIZE or batch_tokens + tokens > LLM_BATCH_TOKEN_BUDGET):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append((str(index), serialized))
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+
+    batch_results = await asyncio.gather(*[
+        _get_context_and_score_for_batch(batch, user_message=user_message) for batch in batches
+    ], return_exceptions=True)
+
+    results = {}
+    for batch_result in batch_results:
+        if isinstance(batch_result, Exception):
+            print(f"Error scoring recommendation batch: {batch_result}")
+            continue
+        results.update(batch_result)
+
+    missing = [index for index in range(len(recommendations)) if str(index) not in results]
+    if missing:
+        print(f"Re-scoring {len(missing)} of {len(recommendations)} recommendations missing from the batch responses")
+        rescored = await asyncio.gather(*[
+            get_context_and_score_for_recommndation_text(recommendations[index], user_message=user_message, recommendation_category=recommendation_category)
+            for index in missing
+        ], return_exceptions=True)
+        for index, context_and_score in zip(missing, rescored):
+            if isinstance(context_and_score, dict):
+                results[str(index)] = context_and_score
+
+    return [results.get(str(index)) for index in range(len(recommendations))]
+
+async def _stream_context_and_score(sys_prompt):
+    """
+    Stream a score-first scoring response, stopping as soon as a failing score is read.
+
+    Returns:
+        dict or None: {'context', 'score'}, with an empty context when the stream was stopped early.
+    """
+    _streaming_stats["streams"] += 1
+    text = ""
+    # Parses the response object as soon as it is complete, while the chunks arrive
+    scanner = JSONScanner('{')
+    usage = None
+    retries = 0
+    started_at = None
+
+    def record(error=None):
+        # Streams stopped early never get the usage, so their tokens are counted locally
+        llm_telemetry.record_llm_call(
+            llm_telemetry.CONTEXT_STREAM,
+            LLM_MODEL_NAME,
+            time.monotonic() - started_at if started_at is not None else 0.0,
+            prompt_tokens=usage.prompt_tokens if usage else count_tokens(sys_prompt),
+            completion_tokens=usage.completion_tokens if usage else count_tokens(text),
+            retries=retries,
+            error=error,
+        )
+
+    try:
+        async with _get_llm_semaphore(LLM_MODEL_NAME):
+            started_at = time.monotonic()
+            raw_response = await get_llm_client().chat.completions.with_raw_response.create(
+                messages=[{"role": "system", "content": sys_prompt}],
+                model=LLM_MODEL_NAME,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=LLM_TIMEOUT,
+            )
+            retries = getattr(raw_response, "retries_taken", 0)
+            stream = raw_response.parse()
+            try:
+                score_seen = False
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content or ""
+                    text += delta
+                    scanner.feed(delta)
+                    if score_seen:
+                        continue
+                    match = STREAMED_SCORE_PATTERN.search(text)
+                    if match is None:
+                        continue
+                    score_seen = True
+                    score = float(match.group(1))
+                    score = int(score) if score.is_integer() else score
+                    if score <= MIN_PASSING_SCORE:
+                        # The context of a rejected recommendation is never used, stop paying for it
+                        _streaming_stats["aborted"] += 1
+                        record()
+                        return {'context': '', 'score': score}
+            finally:
+                await stream.close()
+    except Exception as e:
+        _streaming_stats["failed"] += 1
+        record(error=e)
+        print(f"Error streaming LLM response: {e}")
+        return None
+
+    _streaming_stats["completed"] += 1
+    record()
+    if scanner.first() is None:
+        scanner.finish()
+    score_context_data = scanner.first()
+    if isinstance(score_context_data, dict) and score_context_data:
+        return score_context_data
+    llm_telemetry.record_parse_failure(llm_telemetry.CONTEXT_STREAM, LLM_MODEL_NAME)
+    print("No valid context data found in the streamed LLM response.")
+    return None
+
+async def get_context_and_score_for_recommendation_streamed(recommendation, user_message=None, recommendation_category=None):
+    """
+    Get the context and score for a recommendation, streaming the response with the score first.
+
+    Generation is stopped as soon as the score shows the recommendation will not be saved,
+    so no context is generated for rejected recommendations.
+
+    Args:
+        recommendation (dict): The recommendation data.
+        user_message (str, optional): The user's message to include in the context.
+        recommendation_category (str, optional): The category of recommendations, used to pick the prompt token budget.
+
+    Returns:
+        dict or None: {'context', 'score'}, the context is empty for recommendations not above MIN_PASSING_SCORE.
+    """
+    sys_prompt = prompts.STREAMING_RECOMMENDATION_CONTEXT_PROMPT.format(
+        recommendation=_to_json(serialize_recommendation_for_prompt(recommendation, recommendation_category)),
+        user_message=user_message if user_message else "No user message provided."
+    )
+    key = hashlib.sha1(f"{LLM_MODEL_NAME}\x00stream\x00{sys_prompt}".encode("utf-8")).hexdigest()
+    return await _run_shared_llm_call(key, _stream_context_and_score, sys_prompt)
+
+def get_streaming_stats():
+    """
+    Get the streamed scoring counters.
+
+    Returns:
+        dict: The number of streams started, stopped early on a failing score, completed and failed.
+    """
+    return dict(_streaming_stats)
@@ -0,0 +1,261 @@
+from config import LLM_TELEMETRY_RECENT_REQUESTS
+from collections import deque
+from contextvars import ContextVar
+import bisect
+import time
+
+# Prompt types of the LLM calls
+DECOMPOSITION = "decomposition"
+CONTEXT = "context"
+CONTEXT_BATCH = "context_batch"
+CONTEXT_STREAM = "context_stream"
+
+# Upper bounds (in milliseconds) of the latency histogram buckets, the last bucket is open ended
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile as the upper bound of the bucket it falls in, capped at the maximum seen.
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return round(min(float(self.bounds[index]), self.max), 2) if index < len(self.bounds) else round(self.max, 2)
+        return round(self.max, 2)
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 2) if self.count else 0.0,
+            "max": round(self.max, 2),
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+# Aggregated metrics: (prompt type, model) -> counters and latency histogram
+_calls = {}
+
+# Summary of the LLM calls of the recommendation request being processed
+_request_summary = ContextVar("llm_request_summary", default=None)
+
+# LLM calls and parse failures of a shared (single-flight) call, so every request waiting on it can add them to its own summary
+_captured_calls = ContextVar("llm_captured_calls", default=None)
+
+# Most recently finished request summaries
+_recent_requests = deque(maxlen=LLM_TELEMETRY_RECENT_REQUESTS)
+
+def _new_counters():
+    return {
+        "calls": 0,
+        "errors": 0,
+        "error_types": {},
+        "parse_failures": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency_ms": LatencyHistogram(),
+    }
+
+def record_llm_call(prompt_type, model, latency, prompt_tokens=0, completion_tokens=0, retries=0, error=None):
+    """
+    Record one LLM call.
+
+    Args:
+        prompt_type (str): The prompt type (e.g. DECOMPOSITION or CONTEXT).
+        model (str): The model called.
+        latency (float): The latency of the call in seconds.
+        prompt_tokens (int): The prompt tokens used.
+        completion_tokens (int): The completion tokens used.
+        retries (int): The retries made by the client.
+        error (Exception, optional): The error the call failed with.
+
+    Returns:
+        None
+    """
+    counters = _calls.get((prompt_type, model))
+    if counters is None:
+        counters = _calls[(prompt_type, model)] = _new_counters()
+    latency_ms = latency * 1000
+    counters["calls"] += 1
+    counters["retries"] += retries or 0
+    counters["prompt_tokens"] += prompt_tokens or 0
+    counters["completion_tokens"] += completion_tokens or 0
+    counters["latency_ms"].observe(latency_ms)
+    if error is not None:
+        counters["errors"] += 1
+        error_type = type(error).__name__
+        counters["error_types"][error_type] = counters["error_types"].get(error_type, 0) + 1
+
+    call = {
+        "prompt_type": prompt_type,
+        "latency_ms": latency_ms,
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+        "error": error is not None,
+    }
+    captured = _captured_calls.get()
+    if captured is not None:
+        captured["calls"].append(call)
+    summary = _request_summary.get()
+    if summary is not None:
+        _add_to_summary(summary, call)
+
+def _add_to_summary(summary, call, shared=False):
+    by_type = summary["by_prompt_type"].setdefault(
+        call["prompt_type"], {"calls": 0, "shared_calls": 0, "latency_ms": 0.0, "tokens": 0, "errors": 0}
+    )
+    by_type["calls"] += 1
+    by_type["shared_calls"] += 1 if shared else 0
+    by_type["latency_ms"] += call["latency_ms"]
+    by_type["tokens"] += call["prompt_tokens"] + call["completion_tokens"]
+    by_type["errors"] += 1 if call["error"] else 0
+    summary["calls"] += 1
+    summary["shared_calls"] += 1 if shared else 0
+    summary["llm_latency_ms"] += call["latency_ms"]
+    summary["prompt_tokens"] += call["prompt_tokens"]
+    summary["completion_tokens"] += call["completion_tokens"]
+    summary["errors"] += 1 if call["error"] else 0
+
+def capture_llm_calls():
+    """
+    Collect the LLM calls and parse failures from here on instead of adding them to the current request summary.
+
+    Meant to be called at the start of a shared call's task: the task runs in a copy of the
+    context of the request that created it, so without this its calls would only be added to
+    that request's summary.
+
+    Returns:
+        dict: {'calls', 'parse_failures'}, filled in as the calls are recorded.
+    """
+    captured = {"calls": [], "parse_failures": 0}
+    _request_summary.set(None)
+    _captured_calls.set(captured)
+    return captured
+
+def record_captured_calls(captured, shared=False):
+    """
+    Add the LLM calls and parse failures of a shared call to the summary of the current request.
+
+    Args:
+        captured (dict): What `capture_llm_calls` collected.
+        shared (bool): Whether the request joined a call another request had already started.
+
+    Returns:
+        None
+    """
+    summary = _request_summary.get()
+    if summary is not None:
+        for call in captured["calls"]:
+            _add_to_summary(summary, call, shared=shared)
+        summary["parse_failures"] += captured["parse_failures"]
+
+def record_parse_failure(prompt_type, model):
+    """
+    Record an LLM response that could not be parsed.
+
+    Args:
+        prompt_type (str): The prompt type.
+        model (str): The model called.
+
+    Returns:
+        None
+    """
+    counters = _calls.get((prompt_type, model))
+    if counters is None:
+        counters = _calls[(prompt_type, model)] = _new_counters()
+    counters["parse_failures"] += 1
+    captured = _captured_calls.get()
+    if captured is not None:
+        captured["parse_failures"] += 1
+    summary = _request_summary.get()
+    if summary is not None:
+        summary["parse_failures"] += 1
+
+def start_request_summary(label):
+    """
+    Start collecting the LLM calls of a recommendation request.
+
+    The summary is kept in a context variable, so tasks created from here on (such as the
+    enrichment of the recommendations) add their calls to the same summary.
+
+    Args:
+        label (str): What the request is, shown with the summary.
+
+    Returns:
+        dict: The new summary.
+    """
+    summary = {
+        "label": label,
+        "started_at": time.time(),
+        "calls": 0,
+        "shared_calls": 0,
+        "llm_latency_ms": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "errors": 0,
+        "parse_failures": 0,
+        "by_prompt_type": {},
+    }
+    _request_summary.set(summary)
+    return summary
+
+def finish_request_summary():
+    """
+    Finish the summary of the current request, keep it with the recent ones and log it.
+
+    Returns:
+        dict or None: The finished summary, None if no summary was started.
+    """
+    summary = _request_summary.get()
+    if summary is None or "wall_time_ms" in summary:
+        return summary
+    summary["wall_time_ms"] = round((time.time() - summary["started_at"]) * 1000, 2)
+    summary["llm_latency_ms"] = round(summary["llm_latency_ms"], 2)
+    for by_type in summary["by_prompt_type"].values():
+        by_type["latency_ms"] = round(by_type["latency_ms"], 2)
+    _recent_requests.append(summary)
+    print(
+        f"LLM summary for {summary['label']}: {summary['calls']} calls ({summary['shared_calls']} shared), "
+        f"{summary['llm_latency_ms']}ms in LLM calls over {summary['wall_time_ms']}ms, {summary['prompt_tokens']}+{summary['completion_tokens']} tokens, "
+        f"{summary['errors']} errors, {summary['parse_failures']} parse failures"
+    )
+    return summary
+
+def get_llm_telemetry():
+    """
+    Get the LLM call metrics.
+
+    Returns:
+        dict: Per prompt type and model counters with latency histograms, and the recent request summaries.
+    """
+    return {
+        "calls": {
+            f"{prompt_type}:{model}": {**counters, "latency_ms": counters["latency_ms"].to_dict()}
+            for (prompt_type, model), counters in _calls.items()
+        },
+        "recent_requests": list(_recent_requests),
+    }
@@ -0,0 +1,178 @@
+from config import PRE_RANK_ENABLED, PRE_RANK_TOP_K, PRE_RANK_TOP_K_PER_CATEGORY, PRE_RANK_DEFAULT_RADIUS
+from datetime import datetime
+import re
+import numpy as np
+
+# Weight of each signal in the local relevance score, signals that do not apply are left out
+SIGNAL_WEIGHTS = {
+    "qloo_rank": 0.2,
+    "tag_overlap": 0.35,
+    "popularity": 0.2,
+    "recency": 0.15,
+    "distance": 0.1,
+}
+
+# Releases within this many years count as recent
+RECENT_YEARS = 5
+
+EARTH_RADIUS_KM = 6371.0
+
+_stats = {
+    "pages": 0,
+    "candidates": 0,
+    "selected": 0,
+    "dropped": 0,
+}
+
+def tokenize(text):
+    return set(re.findall(r'\w+', (text or '').lower()))
+
+def get_top_k(recommendation_category):
+    """
+    Get how many candidates of a category go on to LLM scoring.
+
+    Args:
+        recommendation_category (str): The category of recommendations.
+
+    Returns:
+        int: The number of candidates kept, 0 or less keeps them all.
+    """
+    return PRE_RANK_TOP_K_PER_CATEGORY.get(recommendation_category, PRE_RANK_TOP_K)
+
+def _get_year(recommendation):
+    value = recommendation.release_date or recommendation.publication_date
+    match = re.search(r'\d{4}', str(value)) if value else None
+    return float(match.group(0)) if match else np.nan
+
+def _get_popularity(recommendation):
+    try:
+        return float(recommendation.extra_data.get('popularity'))
+    except (TypeError, ValueError):
+        return np.nan
+
+def _get_coordinates(recommendation):
+    location = recommendation.extra_data.get('location')
+    if not isinstance(location, dict):
+        return np.nan, np.nan
+    try:
+        return float(location.get('lat')), float(location.get('lon'))
+    except (TypeError, ValueError):
+        return np.nan, np.nan
+
+def _tag_overlap(recommendation, tag_id, query_tokens):
+    """
+    Get how much a recommendation's tags and title overlap the resolved tag and keyword, from 0 to 1.
+    """
+    if tag_id and any(tag.id == tag_id for tag in recommendation.tags):
+        return 1.0
+    if not query_tokens:
+        return 0.0 if tag_id else np.nan
+    candidate_tokens = tokenize(recommendation.title)
+    for tag in recommendation.tags:
+        candidate_tokens |= tokenize(tag.name)
+    if recommendation.genre:
+        candidate_tokens |= tokenize(recommendation.genre)
+    return len(query_tokens & candidate_tokens) / len(query_tokens)
+
+def score_recommendations(recommendations, tag_id=None, keyword=None, should_be_recent=False, location_details=None):
+    """
+    Compute a local relevance score for each recommendation of a page.
+
+    The score is a weighted sum of signals scaled to 0-1: the position Qloo returned the
+    recommendation at, the overlap of its tags with the resolved tag or keyword, its Qloo
+    popularity, how recent it is (only when recent ones were asked for) and, for places,
+    how close it is to the requested location. Signals no recommendation has are left out
+    and missing values get the page average, so they neither help nor hurt.
+
+    Args:
+        recommendations (list): The Recommendation objects of the page.
+        tag_id (str, optional): The resolved tag ID.
+        keyword (str, optional): The keyword or generic term of the user's message.
+        should_be_recent (bool): Whether the user asked for recent recommendations.
+        location_details (dict, optional): The location details with 'latitude', 'longitude' and 'max_radius'.
+
+    Returns:
+        numpy.ndarray: The scores, in the order of the recommendations.
+    """
+    count = len(recommendations)
+    if count == 0:
+        return np.zeros(0)
+
+    query_tokens = tokenize(keyword)
+    signals = {
+        "qloo_rank": 1.0 - np.arange(count) / count,
+        "tag_overlap": np.array([_tag_overlap(rec, tag_id, query_tokens) for rec in recommendations], dtype=float),
+    }
+
+    popularity = np.array([_get_popularity(rec) for rec in recommendations], dtype=float)
+    signals["popularity"] = np.clip(popularity, 0.0, 1.0)
+
+    if should_be_recent:
+        years = np.array([_get_year(rec) for rec in recommendations], dtype=float)
+        signals["recency"] = np.clip((years - (datetime.utcnow().year - RECENT_YEARS)) / RECENT_YEARS, 0.0, 1.0)
+
+    latitude = (location_details or {}).get('latitude')
+    longitude = (location_details or {}).get('longitude')
+    if latitude is not None and longitude is not None:
+        coordinates = np.array([_get_coordinates(rec) for rec in recommendations], dtype=float)
+        lat1, lon1 = np.radians(float(latitude)), np.radians(float(longitude))
+        lat2, lon2 = np.radians(coordinates[:, 0]), np.radians(coordinates[:, 1])
+        # Haversine distance in kilometers
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        radius = (location_details or {}).get('max_radius') or PRE_RANK_DEFAULT_RADIUS
+        signals["distance"] = 1.0 - np.clip(distances / float(radius), 0.0, 1.0)
+
+    scores = np.zeros(count)
+    total_weight = 0.0
+    for name, values in signals.items():
+        known = ~np.isnan(values)
+        if not known.any():
+            continue
+        values = np.where(known, values, values[known].mean())
+        scores += SIGNAL_WEIGHTS[name] * values
+        total_weight += SIGNAL_WEIGHTS[name]
+    return scores / total_weight if total_weight else scores
+
+def select_candidates(recommendation_category, recommendations, tag_id=None, keyword=None, should_be_recent=False, location_details=None):
+    """
+    Keep the top-K recommendations of a page by local relevance, so only those are scored by the LLM.
+
+    Args:
+        recommendation_category (str): The category of recommendations, used to pick K.
+        recommendations (list): The Recommendation objects of the page.
+        tag_id (str, optional): The resolved tag ID.
+        keyword (str, optional): The keyword or generic term of the user's message.
+        should_be_recent (bool): Whether the user asked for recent recommendations.
+        location_details (dict, optional): The requested location details.
+
+    Returns:
+        list: The kept recommendations, in their original order.
+    """
+    top_k = get_top_k(recommendation_category)
+    if not PRE_RANK_ENABLED or top_k <= 0 or len(recommendations) <= top_k:
+        return recommendations
+
+    scores = score_recommendations(
+        recommendations,
+        tag_id=tag_id,
+        keyword=keyword,
+        should_be_recent=should_be_recent,
+        location_details=location_details
+    )
+    keep = np.sort(np.argsort(-scores, kind='stable')[:top_k])
+
+    _stats["pages"] += 1
+    _stats["candidates"] += len(recommendations)
+    _stats["selected"] += len(keep)
+    _stats["dropped"] += len(recommendations) - len(keep)
+    return [recommendations[index] for index in keep]
+
+def get_pre_ranker_stats():
+    """
+    Get the pre-ranker counters.
+
+    Returns:
+        dict: The number of pages ranked and of candidates kept and dropped.
+    """
+    return dict(_stats)
@@ -0,0 +1,143 @@
+from config import QLOO_PREFETCH_ENABLED, QLOO_PREFETCH_DEPTH, QLOO_PREFETCH_MAX_QUERIES, QLOO_PREFETCH_TTL
+from collections import OrderedDict
+from utils import clean_text
+import asyncio
+import time
+
+# Per-query buffer of speculatively fetched pages: query key -> {page: (created_at, task)}
+# Queries are kept in LRU order so the least recently used one is dropped first
+_buffers = OrderedDict()
+
+_stats = {
+    "scheduled": 0,
+    "hits": 0,
+    "misses": 0,
+    "failed": 0,
+    "expired": 0,
+    "evicted": 0,
+}
+
+def get_query_key(session_id, recommendation_category, user_message, tag_id):
+    """
+    Build the buffer key of a recommendation query.
+
+    Args:
+        session_id (str): The session ID.
+        recommendation_category (str): The category of recommendations.
+        user_message (str): The user's message.
+        tag_id (str): The tag ID used for the recommendations.
+
+    Returns:
+        tuple: The query key.
+    """
+    return (session_id, recommendation_category, clean_text(user_message), tag_id)
+
+def _drop_page(page_tasks, page):
+    _, task = page_tasks.pop(page)
+    if not task.done():
+        task.cancel()
+
+def _evict_query(query_key):
+    page_tasks = _buffers.pop(query_key, {})
+    for page in list(page_tasks):
+        _drop_page(page_tasks, page)
+        _stats["evicted"] += 1
+
+def _on_prefetch_done(task):
+    if not task.cancelled() and task.exception() is not None:
+        _stats["failed"] += 1
+        print(f"Error prefetching recommendations: {task.exception()}")
+
+def schedule_prefetch(query_key, next_page, fetch_page):
+    """
+    Start fetching the pages after the current one in the background.
+
+    Up to QLOO_PREFETCH_DEPTH pages starting at `next_page` are fetched and parked in the
+    query's buffer. Pages already buffered are not fetched again.
+
+    Args:
+        query_key (tuple): The query key from get_query_key.
+        next_page (int): The first page to prefetch.
+        fetch_page (callable): Coroutine function taking a page number and returning the transformed recommendations.
+
+    Returns:
+        None
+    """
+    if not QLOO_PREFETCH_ENABLED or QLOO_PREFETCH_DEPTH <= 0:
+        return
+
+    page_tasks = _buffers.setdefault(query_key, {})
+    _buffers.move_to_end(query_key)
+
+    # Pages before the next one will never be asked for again
+    for page in [p for p in page_tasks if p < next_page]:
+        _drop_page(page_tasks, page)
+        _stats["evicted"] += 1
+
+    for page in range(next_page, next_page + QLOO_PREFETCH_DEPTH):
+        if page in page_tasks:
+            continue
+        task = asyncio.create_task(fetch_page(page))
+        task.add_done_callback(_on_prefetch_done)
+        page_tasks[page] = (time.monotonic(), task)
+        _stats["scheduled"] += 1
+
+    while len(_buffers) > QLOO_PREFETCH_MAX_QUERIES:
+        oldest_key = next(iter(_buffers))
+        _evict_query(oldest_key)
+
+async def take_prefetched(query_key, page):
+    """
+    Take a prefetched page out of the buffer, waiting for it if it is still being fetched.
+
+    Args:
+        query_key (tuple): The query key from get_query_key.
+        page (int): The page wanted.
+
+    Returns:
+        list or None: The transformed recommendations, None if the page was not prefetched or the prefetch failed.
+    """
+    page_tasks = _buffers.get(query_key)
+    if not page_tasks or page not in page_tasks:
+        _stats["misses"] += 1
+        return None
+
+    created_at, task = page_tasks.pop(page)
+    if not page_tasks:
+        del _buffers[query_key]
+
+    if time.monotonic() - created_at > QLOO_PREFETCH_TTL:
+        if not task.done():
+            task.cancel()
+        _stats["expired"] += 1
+        return None
+
+    if task.cancelled():
+        _stats["misses"] += 1
+        return None
+    try:
+        recommendations = await task
+    except Exception:
+        _stats["misses"] += 1
+        return None
+
+    if not recommendations:
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    return recommendations
+
+def get_prefetch_stats():
+    """
+    Get the prefetch buffer counters.
+
+    Returns:
+        dict: The counters along with the number of buffered queries and pages.
+    """
+    return {
+        **_stats,
+        "buffered_queries": len(_buffers),
+        "buffered_pages": sum(len(page_tasks) for page_tasks in _buffers.values()),
+        "max_queries": QLOO_PREFETCH_MAX_QUERIES,
+        "depth": QLOO_PREFETCH_DEPTH,
+    }
@@ -0,0 +1,166 @@
+from config import (
+    QLOO_CACHE_ENABLED, QLOO_CACHE_MAX_ENTRIES, QLOO_CACHE_TTL_TAGS, QLOO_CACHE_TTL_SEARCH,
+    QLOO_CACHE_TTL_INSIGHTS, QLOO_CACHE_MONGO_ENABLED
+)
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import asyncio
+import json
+import re
+import time
+import db
+
+# TTL (in seconds) for each Qloo endpoint family
+CACHE_TTLS = {
+    "tags": QLOO_CACHE_TTL_TAGS,
+    "search": QLOO_CACHE_TTL_SEARCH,
+    "insights": QLOO_CACHE_TTL_INSIGHTS,
+}
+
+# Query params that must never end up in a cache key
+SENSITIVE_PARAMS = {"api_key", "apikey", "x-api-key", "key"}
+
+# In-process LRU: cache_key -> (expires_at monotonic time, response data)
+_cache = OrderedDict()
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "mongo_hits": 0,
+    "expired": 0,
+    "evictions": 0,
+}
+
+def get_endpoint_family(path):
+    """
+    Get the endpoint family of a Qloo API path.
+
+    Args:
+        path (str): The path part of the Qloo endpoint.
+
+    Returns:
+        str or None: 'tags', 'search' or 'insights', None if the endpoint is not cacheable.
+    """
+    if path.endswith("/v2/tags"):
+        return "tags"
+    if path.endswith("/search"):
+        return "search"
+    if path.endswith("/v2/insights"):
+        return "insights"
+    return None
+
+def get_cache_key(endpoint):
+    """
+    Build the canonical cache key for a Qloo endpoint.
+
+    Query params are sorted and any API key params are stripped, so the same request
+    built in a different order maps to the same key.
+
+    Args:
+        endpoint (str): The full Qloo endpoint URL.
+
+    Returns:
+        tuple: (cache_key, family), (None, None) if caching is disabled or the endpoint is not cacheable.
+    """
+    if not QLOO_CACHE_ENABLED:
+        return None, None
+
+    parts = urlsplit(endpoint)
+    # QLOO_API_URL may or may not end with '/', so endpoints can contain '//'
+    path = re.sub(r"/{2,}", "/", parts.path)
+    family = get_endpoint_family(path)
+    if family is None:
+        return None, None
+
+    params = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in SENSITIVE_PARAMS
+    )
+    return f"{parts.netloc}{path}?{urlencode(params)}", family
+
+def _store_in_memory(cache_key, data, expires_at):
+    _cache[cache_key] = (expires_at, data)
+    _cache.move_to_end(cache_key)
+    while len(_cache) > QLOO_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+async def get_cached_response(cache_key):
+    """
+    Get a cached Qloo response, checking the in-process LRU first and then Mongo if enabled.
+
+    Args:
+        cache_key (str): The canonical cache key.
+
+    Returns:
+        dict or None: The cached response data if found and fresh, otherwise None.
+    """
+    entry = _cache.get(cache_key)
+    if entry is not None:
+        expires_at, data = entry
+        if expires_at > time.monotonic():
+            _cache.move_to_end(cache_key)
+            _stats["hits"] += 1
+            return data
+        del _cache[cache_key]
+        _stats["expired"] += 1
+
+    if QLOO_CACHE_MONGO_ENABLED:
+        try:
+            cached = await db.get_cached_qloo_response(cache_key)
+        except Exception as e:
+            print(f"Error reading Qloo cache from database: {e}")
+            cached = None
+        if cached is not None:
+            serialized, expires_at = cached
+            data = json.loads(serialized)
+            remaining = (expires_at - datetime.utcnow()).total_seconds()
+            _store_in_memory(cache_key, data, time.monotonic() + remaining)
+            _stats["hits"] += 1
+            _stats["mongo_hits"] += 1
+            return data
+
+    _stats["misses"] += 1
+    return None
+
+async def set_cached_response(cache_key, family, data):
+    """
+    Cache a Qloo response in the in-process LRU and, if enabled, in Mongo.
+
+    Args:
+        cache_key (str): The canonical cache key.
+        family (str): The endpoint family, used to pick the TTL.
+        data (dict): The response data.
+
+    Returns:
+        None
+    """
+    ttl = CACHE_TTLS.get(family, 0)
+    if ttl <= 0:
+        return
+    _store_in_memory(cache_key, data, time.monotonic() + ttl)
+
+    if QLOO_CACHE_MONGO_ENABLED:
+        # Writing to the shared tier should not hold up the response
+        asyncio.create_task(db.set_cached_qloo_response(
+            cache_key,
+            family,
+            json.dumps(data),
+            datetime.utcnow() + timedelta(seconds=ttl)
+        ))
+
+def get_cache_stats():
+    """
+    Get the Qloo cache hit/miss counters.
+
+    Returns:
+        dict: The counters along with the current size and hit rate.
+    """
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_cache),
+        "max_size": QLOO_CACHE_MAX_ENTRIES,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
@@ -1,7 +1,26 @@
-from config import QLOO_API_URL, QLOO_API_KEY
-import requests
+from config import (
+    QLOO_API_URL, QLOO_API_KEY, QLOO_MAX_CONNECTIONS, QLOO_MAX_KEEPALIVE_CONNECTIONS,
+    QLOO_KEEPALIVE_EXPIRY, QLOO_CONNECT_TIMEOUT, QLOO_TIMEOUT, QLOO_HTTP2,
+    QLOO_BACKUP_FANOUT_ENABLED, QLOO_BACKUP_FANOUT_CONCURRENCY, QLOO_BACKUP_FANOUT_DEADLINE,
+    HTML_CLEAN_MEMO_SIZE, QLOO_TRANSFORM_PROCESS_POOL_THRESHOLD, QLOO_TRANSFORM_PROCESS_POOL_WORKERS,
+    QLOO_RATE_LIMIT_RPS, QLOO_RATE_LIMIT_BURST, QLOO_CONCURRENCY_INITIAL, QLOO_CONCURRENCY_MIN, QLOO_CONCURRENCY_MAX,
+    QLOO_MAX_RETRIES, QLOO_RETRY_BUDGET, QLOO_RETRY_BASE_DELAY, QLOO_RETRY_MAX_DELAY
+)
+from core import qloo_cache, tag_index
+from core.single_flight import SingleFlight
+from core.rate_limiter import TokenBucket, AIMDLimiter
+import asyncio
+import httpx
+import importlib.util
 import re
-from bs4 import BeautifulSoup
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from utils import strip_html
+from dtos.recommendation_model import Recommendation, Tag
+import random
+import sys
 
 ENTITIES= {
     "movies": "urn:entity:movie",
@@ -94,11 +113,182 @@ def get_qloo_tags_endpoint(entity, query= None):
         query = f"&filter.query={query}"
     return f"{QLOO_API_URL}v2/tags?feature.typo_tolerance=true&filter.parents.types={entity}{query}"
 
-def make_qloo_request(endpoint):
-    response = requests.get(endpoint, headers=QLOO_HEADER)
-    if response.status_code != 200:
-        raise Exception(f"Error fetching data from Qloo API: {response.status_code} - {response.text}")
-    return response.json()
+# Shared async client, created lazily on first use so it binds to the running event loop
+_qloo_client = None
+
+def get_qloo_client():
+    """
+    Get the shared Qloo HTTP client, creating it if needed.
+
+    The client keeps a pool of keep-alive connections (HTTP/2 when the `h2` package
+    is installed) so Qloo calls do not pay a fresh TCP+TLS handshake each time.
+
+    Returns:
+        httpx.AsyncClient: The shared client.
+    """
+    global _qloo_client
+    if _qloo_client is None or _qloo_client.is_closed:
+        use_http2 = QLOO_HTTP2 and importlib.util.find_spec("h2") is not None
+        _qloo_client = httpx.AsyncClient(
+            headers=QLOO_HEADER,
+            http2=use_http2,
+            limits=httpx.Limits(
+                max_connections=QLOO_MAX_CONNECTIONS,
+                max_keepalive_connections=QLOO_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=QLOO_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(QLOO_TIMEOUT, connect=QLOO_CONNECT_TIMEOUT),
+        )
+    return _qloo_client
+
+async def close_qloo_client():
+    """
+    Close the shared Qloo HTTP client and release its pooled connections.
+    """
+    global _qloo_client
+    if _qloo_client is not None:
+        await _qloo_client.aclose()
+        _qloo_client = None
+
+# Request rate and adaptive concurrency limits in front of the Qloo client
+qloo_token_bucket = TokenBucket(QLOO_RATE_LIMIT_RPS, QLOO_RATE_LIMIT_BURST)
+qloo_concurrency_limiter = AIMDLimiter(
+    initial_limit=QLOO_CONCURRENCY_INITIAL,
+    min_limit=max(1, QLOO_CONCURRENCY_MIN),
+    max_limit=QLOO_CONCURRENCY_MAX,
+)
+
+_qloo_request_stats = {
+    "requests": 0,
+    "retries": 0,
+    "throttled": 0,
+    "server_errors": 0,
+    "transport_errors": 0,
+    "failures": 0,
+}
+
+def _get_retry_after_seconds(response):
+    """
+    Get the delay requested by a Retry-After header, in seconds (None if absent or invalid).
+    """
+    retry_after = response.headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+async def _send_qloo_request(endpoint):
+    """
+    Send a GET request to Qloo through the rate and concurrency limiters.
+
+    429 and 5xx responses and transport errors (timeouts, dropped connections) lower the
+    concurrency limit and are retried with jittered exponential backoff, or after the
+    Retry-After delay when Qloo gives one, as long as the retry fits in QLOO_RETRY_BUDGET.
+
+    Args:
+        endpoint (str): The full Qloo endpoint URL.
+
+    Returns:
+        dict: The response JSON.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + QLOO_RETRY_BUDGET
+    attempt = 0
+    while True:
+        await qloo_token_bucket.acquire()
+        await qloo_concurrency_limiter.acquire()
+        _qloo_request_stats["requests"] += 1
+        outcome = AIMDLimiter.IGNORE
+        retry_after = None
+        try:
+            response = await get_qloo_client().get(endpoint)
+            if response.status_code == 200:
+                outcome = AIMDLimiter.SUCCESS
+                return response.json()
+
+            error = Exception(f"Error fetching data from Qloo API: {response.status_code} - {response.text}")
+            if response.status_code == 429:
+                _qloo_request_stats["throttled"] += 1
+            elif response.status_code >= 500:
+                _qloo_request_stats["server_errors"] += 1
+            else:
+                raise error
+            outcome = AIMDLimiter.OVERLOAD
+            retry_after = _get_retry_after_seconds(response)
+            if retry_after:
+                # Hold back every caller, not only this one
+                qloo_token_bucket.pause(retry_after)
+        except httpx.TransportError as e:
+            _qloo_request_stats["transport_errors"] += 1
+            outcome = AIMDLimiter.OVERLOAD
+            error = e
+        finally:
+            qloo_concurrency_limiter.release(outcome)
+
+        attempt += 1
+        if retry_after is not None:
+            delay = retry_after
+        else:
+            delay = min(QLOO_RETRY_MAX_DELAY, QLOO_RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        if attempt > QLOO_MAX_RETRIES or loop.time() + delay > deadline:
+            _qloo_request_stats["failures"] += 1
+            raise error
+        _qloo_request_stats["retries"] += 1
+        print(f"Retrying Qloo request in {delay:.2f}s (attempt {attempt} of {QLOO_MAX_RETRIES}) after error: {error}")
+        await asyncio.sleep(delay)
+
+def get_qloo_limiter_stats():
+    """
+    Get the current Qloo rate and concurrency limits along with request counters.
+
+    Returns:
+        dict: The limiter metrics.
+    """
+    return {
+        **_qloo_request_stats,
+        "rate_limit": qloo_token_bucket.get_stats(),
+        "concurrency": qloo_concurrency_limiter.get_stats(),
+    }
+
+# Identical Qloo requests in flight at the same time share one call
+qloo_single_flight = SingleFlight("qloo")
+
+async def _fetch_and_cache(endpoint, cache_key, family):
+    data = await _send_qloo_request(endpoint)
+    if cache_key is not None:
+        await qloo_cache.set_cached_response(cache_key, family, data)
+    return data
+
+async def fetch_qloo_response(endpoint):
+    """
+    Fetch a Qloo response through the rate and concurrency limiters, bypassing the response cache.
+
+    Meant for refreshing data kept outside the cache, such as the local tag indexes.
+
+    Args:
+        endpoint (str): The full Qloo endpoint URL.
+
+    Returns:
+        dict: The response JSON.
+    """
+    return await _send_qloo_request(endpoint)
+
+async def make_qloo_request(endpoint):
+    cache_key, family = qloo_cache.get_cache_key(endpoint)
+    if cache_key is not None:
+        cached = await qloo_cache.get_cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+    return await qloo_single_flight.run(cache_key or endpoint, _fetch_and_cache, endpoint, cache_key, family)
 
 def loosely_matches(query: str, target: str) -> bool:
     # Normalize: lowercase, remove punctuation, split into words
@@ -111,14 +301,20 @@ def loosely_matches(query: str, target: str) -> bool:
     # Check if query tokens are a subset of target tokens or vice versa
     return query_tokens.issubset(target_tokens) or target_tokens.issubset(query_tokens)
 
-def get_qloo_tag_to_use_for_non_specific(entity_name, query = None, backups= None):
-    qloo_enity = ENTITIES.get(entity_name)
-    if not qloo_enity:
-        raise ValueError(f"Invalid entity name: {entity_name}")
-    look_for_genre = entity_name in ['movies', 'tv_shows', 'books']
-    endpoint = get_qloo_tags_endpoint(qloo_enity, query)
-    print(f"Fetching tags from Qloo API for {entity_name} with query '{query}' with endpoint {endpoint}")
-    data = make_qloo_request(endpoint)
+def select_tag_to_use(tags, query, look_for_genre=True, match_required=False):
+    """
+    Pick the tag to use for a generic term from a list of candidate tags.
+
+    Args:
+        tags (list): Candidate tags, best ranked first.
+        query (str): The generic term.
+        look_for_genre (bool): Whether genre/keyword priority rules apply; if not, the first tag is used.
+        match_required (bool): Only pick a tag whose name matches the term exactly or as a substring,
+            with no fallback to the first genre.
+
+    Returns:
+        str or None: The tag ID to use.
+    """
     # Candidates for all match types, ordered by priority
     exact_genre_match = None
     substring_genre_match = None
@@ -128,7 +324,7 @@ def get_qloo_tag_to_use_for_non_specific(entity_name, query = None, backups= Non
     # Clean the query term once
     query = query.strip().lower()
 
-    for i, tag in enumerate(data.get("results", {}).get("tags", [])):
+    for i, tag in enumerate(tags):
         if i >= 10:
             break
 
@@ -145,7 +341,9 @@ def get_qloo_tag_to_use_for_non_specific(entity_name, query = None, backups= Non
         # --- Prioritized Logic ---
         if not look_for_genre:
             # If not looking for genre, return the first tag:
-            return tag_id
+            if not match_required or loosely_matches(tag_name, query):
+                return tag_id
+            continue
 
         if is_genre:
             # Check for exact match (highest priority)
@@ -175,25 +373,171 @@ def get_qloo_tag_to_use_for_non_specific(entity_name, query = None, backups= Non
     # --- Final Decision ---
     # Return the best candidate found, in order of priority
     return (
-        exact_keyword_match or substring_keyword_match or exact_genre_match or substring_genre_match or first_genre_fallback
+        exact_keyword_match or substring_keyword_match or exact_genre_match or substring_genre_match
+        or (None if match_required else first_genre_fallback)
     )
 
+async def get_qloo_tag_to_use_for_non_specific(entity_name, query = None, backups= None):
+    qloo_enity = ENTITIES.get(entity_name)
+    if not qloo_enity:
+        raise ValueError(f"Invalid entity name: {entity_name}")
+    look_for_genre = entity_name in ['movies', 'tv_shows', 'books']
+
+    # Resolve against the local tag index first, only going to Qloo on a miss. Typo matches of
+    # the index are not trusted on their own, Qloo's search finds the right tag for those
+    indexed_tags = tag_index.lookup_tags(entity_name, query)
+    if indexed_tags:
+        tag_to_use = select_tag_to_use(indexed_tags, query, look_for_genre, match_required=True)
+        if tag_to_use:
+            print(f"Resolved tag {tag_to_use} for {entity_name} with query '{query}' from local tag index")
+            return tag_to_use
 
-def clean_html_text(html_text):
-    # Define tags whose entire content should be removed
-    remove_content_tags = ['i', 'em', 'script', 'style']
+    endpoint = get_qloo_tags_endpoint(qloo_enity, query)
+    print(f"Fetching tags from Qloo API for {entity_name} with query '{query}' with endpoint {endpoint}")
+    data = await make_qloo_request(endpoint)
+    return select_tag_to_use(data.get("results", {}).get("tags", []), query, look_for_genre)
 
-    soup = BeautifulSoup(html_text, "html.parser")
 
-    # Remove specified tags and their content
-    for tag in soup.find_all(remove_content_tags):
-        tag.decompose()
+# Cleaned descriptions memoized by entity ID: entity_id -> (html_text, cleaned_text)
+_clean_html_memo = OrderedDict()
 
-    # Get remaining text
-    cleaned_text = soup.get_text(separator=' ', strip=True)
+def clean_html_text(html_text, entity_id=None):
+    """
+    Strip the markup from an entity description, dropping the content of i/em/script/style tags.
+
+    Args:
+        html_text (str): The description, possibly containing HTML.
+        entity_id (str, optional): The entity ID, used to memoize the cleaned text.
+
+    Returns:
+        str: The cleaned text.
+    """
+    if entity_id is not None:
+        memoized = _clean_html_memo.get(entity_id)
+        if memoized is not None and memoized[0] == html_text:
+            _clean_html_memo.move_to_end(entity_id)
+            return memoized[1]
+
+    # Define tags whose entire content should be removed
+    cleaned_text = strip_html(html_text, skip_tags=('i', 'em', 'script', 'style'))
+
+    if entity_id is not None and HTML_CLEAN_MEMO_SIZE > 0:
+        _clean_html_memo[entity_id] = (html_text, cleaned_text)
+        _clean_html_memo.move_to_end(entity_id)
+        while len(_clean_html_memo) > HTML_CLEAN_MEMO_SIZE:
+            _clean_html_memo.popitem(last=False)
 
     return cleaned_text
 
+# Entity transformers keyed by Qloo entity URN
+ENTITY_TRANSFORMERS = {}
+
+def register_entity_transformer(*entity_urns):
+    """
+    Register a function as the transformer of one or more Qloo entity types.
+
+    Args:
+        *entity_urns (str): The Qloo entity URNs (e.g. 'urn:entity:movie') the function transforms.
+
+    Returns:
+        callable: Decorator returning the function unchanged.
+    """
+    def decorator(transformer):
+        for entity_urn in entity_urns:
+            ENTITY_TRANSFORMERS[entity_urn] = transformer
+        return transformer
+    return decorator
+
+TagTypeInfo = namedtuple('TagTypeInfo', ['is_streaming_service', 'is_genre', 'is_subgenre', 'is_keyword', 'part_count'])
+
+# Parsed tag types, shared by every entity: interned tag type -> TagTypeInfo
+_tag_type_table = {}
+
+def get_tag_type_info(tag_type):
+    """
+    Get the parsed form of a Qloo tag type such as 'urn:tag:genre:media', parsing it only the first time it is seen.
+
+    Args:
+        tag_type (str): The tag type.
+
+    Returns:
+        TagTypeInfo: The flags used by the entity transformers.
+    """
+    info = _tag_type_table.get(tag_type)
+    if info is None:
+        tag_type = sys.intern(tag_type)
+        info = TagTypeInfo(
+            is_streaming_service='streaming_service' in tag_type,
+            is_genre='genre' in tag_type,
+            is_subgenre='subgenre' in tag_type,
+            is_keyword='keyword' in tag_type,
+            part_count=len(tag_type.split(':')),
+        )
+        _tag_type_table[tag_type] = info
+    return info
+
+def transform_batch(entities, entity_urn):
+    """
+    Transform a whole page of Qloo entities of one type in a single pass.
+
+    The transformers resolve tag types through the shared lookup table, which parses each
+    tag type the first time it is seen, so the per-tag work is a dictionary lookup.
+
+    Args:
+        entities (list): The raw Qloo entities.
+        entity_urn (str): The Qloo entity URN of the page.
+
+    Returns:
+        list: The transformed recommendations, skipping entities that could not be transformed.
+    """
+    transformer = ENTITY_TRANSFORMERS.get(entity_urn)
+    if transformer is None:
+        raise ValueError(f"No transformer registered for entity type: {entity_urn}")
+
+    transformed = []
+    for entity in entities:
+        recommendation = transformer(entity)
+        if recommendation:
+            transformed.append(recommendation)
+    return transformed
+
+_transform_pool = None
+
+def _get_transform_pool():
+    global _transform_pool
+    if _transform_pool is None:
+        _transform_pool = ProcessPoolExecutor(max_workers=QLOO_TRANSFORM_PROCESS_POOL_WORKERS)
+    return _transform_pool
+
+def shutdown_transform_pool():
+    """
+    Shut down the process pool used for large pages, if it was started.
+    """
+    global _transform_pool
+    if _transform_pool is not None:
+        _transform_pool.shutdown(wait=False, cancel_futures=True)
+        _transform_pool = None
+
+async def transform_batch_async(entities, entity_urn):
+    """
+    Transform a page of Qloo entities, in a worker process when the page is large.
+
+    Pages with at least QLOO_TRANSFORM_PROCESS_POOL_THRESHOLD entities are transformed in a
+    process pool so they do not hold up the event loop; smaller pages are transformed inline.
+
+    Args:
+        entities (list): The raw Qloo entities.
+        entity_urn (str): The Qloo entity URN of the page.
+
+    Returns:
+        list: The transformed recommendations.
+    """
+    if QLOO_TRANSFORM_PROCESS_POOL_THRESHOLD > 0 and len(entities) >= QLOO_TRANSFORM_PROCESS_POOL_THRESHOLD:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_transform_pool(), transform_batch, entities, entity_urn)
+    return transform_batch(entities, entity_urn)
+
+@register_entity_transformer("urn:entity:movie", "urn:entity:tv_show")
 def transform_movie_entity(entity):
     """
     Transforms a single entity with improved tag filtering and 'where_to_watch' extraction.
@@ -214,19 +558,21 @@ def transform_movie_entity(entity):
         if not tag_name or not tag_type or not tag_id:
             continue
 
+        tag_type_info = get_tag_type_info(tag_type)
+
         # Rule 1: Extract streaming services for 'extra_data'
-        if 'streaming_service' in tag_type:
+        if tag_type_info.is_streaming_service:
             where_to_watch_list.append(tag_name)
 
         # Rule 2: Add all genres to the final 'tags' list
-        elif 'genre' in tag_type and 'subgenre' not in tag_type:
-            filtered_tags.append({"name" : tag_name, "id": tag_id})
+        elif tag_type_info.is_genre and not tag_type_info.is_subgenre:
+            filtered_tags.append(Tag(tag_name, tag_id))
             if not first_genre:
                 first_genre = tag_name
 
         # Rule 3: Add single-word keywords to the final 'tags' list
-        elif 'keyword' in tag_type and ' ' not in tag_name.strip():
-            filtered_tags.append({"name" : tag_name, "id": tag_id})
+        elif tag_type_info.is_keyword and ' ' not in tag_name.strip():
+            filtered_tags.append(Tag(tag_name, tag_id))
 
     # --- 2. Create and populate the 'extra_data' dictionary ---
     extra_data = {
@@ -246,18 +592,17 @@ def transform_movie_entity(entity):
 
     try:
     # --- 3. Assemble and return the final dictionary ---
-        return {
-            'title': entity.get('name'),
-            'id': entity.get('id') or entity.get('entity_id'),
-            'release_date': entity.get('properties', {}).get('release_date'),
-            'description': clean_html_text(entity.get('properties', {}).get('description')),
-            'genre': first_genre,
-            'image': entity.get('properties', {}).get('image'),
+        return Recommendation(
+            title=entity.get('name'),
+            id=entity.get('id') or entity.get('entity_id'),
+            release_date=entity.get('properties', {}).get('release_date'),
+            description=clean_html_text(entity.get('properties', {}).get('description'), entity.get('id') or entity.get('entity_id')),
+            genre=first_genre,
+            image=entity.get('properties', {}).get('image'),
             # Clean the final extra_data to remove empty values (e.g., if where_to_watch is empty)
-            'extra_data': {k: v for k, v in extra_data.items() if v},
-            'tags': filtered_tags,
-            'tags_original': original_tags,
-        }
+            extra_data={k: v for k, v in extra_data.items() if v},
+            tags=filtered_tags,
+        )
     except Exception as e:
         print(f"Error transforming movie entity: {e}")
         return 
@@ -271,10 +616,9 @@ def _get_corrected_tag_id(tag_id, tag_type):
         return tag_id
 
     id_parts = tag_id.split(':')
-    type_parts = tag_type.split(':')
     
     # Position where 'place' should be
-    insert_pos = len(type_parts)
+    insert_pos = get_tag_type_info(tag_type).part_count
     
     # Check if 'place' is already in the correct position
     if len(id_parts) > insert_pos and id_parts[insert_pos] == 'place':
@@ -285,6 +629,7 @@ def _get_corrected_tag_id(tag_id, tag_type):
     return ':'.join(id_parts)
 
 
+@register_entity_transformer("urn:entity:place", "urn:entity:destination")
 def transform_place_entity(entity):
     """
     Transforms a single place entity dictionary, including hours and specialty dishes.
@@ -316,7 +661,7 @@ def transform_place_entity(entity):
         #if 'genre' in tag_type or 'category' in tag_type or 'amenity' in tag_type:
         if tag_name not in seen_names:
             seen_names.add(tag_name)
-            filtered_tags.append({"name": tag_name, "id": tag_id})
+            filtered_tags.append(Tag(tag_name, tag_id))
 
     # --- 2. Create and populate the 'extra_data' dictionary ---
     extra_data = {
@@ -372,17 +717,17 @@ def transform_place_entity(entity):
         image_obj = image_prop
 
     # --- 4. Assemble and return the final dictionary ---
-    return {
-        'title': entity.get('name'),
-        'id': entity.get('id') or entity.get('entity_id'),
-        'description': clean_html_text(properties.get('description', "")),
-        'address': properties.get('address'),
-        'image': image_obj,
-        'tags': filtered_tags,
-        'tags_original': original_tags,
-        'extra_data': {k: v for k, v in extra_data.items() if v is not None and v != ''}
-    }
+    return Recommendation(
+        title=entity.get('name'),
+        id=entity.get('id') or entity.get('entity_id'),
+        description=clean_html_text(properties.get('description', ""), entity.get('id') or entity.get('entity_id')),
+        address=properties.get('address'),
+        image=image_obj,
+        tags=filtered_tags,
+        extra_data={k: v for k, v in extra_data.items() if v is not None and v != ''}
+    )
 
+@register_entity_transformer("urn:entity:book")
 def transform_book_entity(entity):
     """
     Transforms a single book entity, including filtered tags.
@@ -410,8 +755,9 @@ def transform_book_entity(entity):
             continue
 
         # Add tag if its type is 'genre' OR 'keyword'
-        if 'genre' in tag_type or 'keyword' in tag_type:
-            filtered_tags.append({"name" : tag_name, "id": tag_id})
+        tag_type_info = get_tag_type_info(tag_type)
+        if tag_type_info.is_genre or tag_type_info.is_keyword:
+            filtered_tags.append(Tag(tag_name, tag_id))
 
     # --- 2. Create and populate the 'extra_data' dictionary ---
     extra_data = {
@@ -429,20 +775,86 @@ def transform_book_entity(entity):
                 extra_data[key] = {k: v for k, v in first_item.items() if k != 'id'}
 
     # --- 3. Assemble and return the final dictionary ---
-    return {
-        'title': entity.get('name'),
-        'id': entity.get('id') or entity.get('entity_id'),
-        'author': clean_author(entity.get('disambiguation')) if entity.get('disambiguation') else None,
-        'publication_date': properties.get('publication_date'),
-        'image': properties.get('image'),
-        'description': clean_html_text(properties.get('description')),
-        'extra_data': {k: v for k, v in extra_data.items() if v},
-        'tags': filtered_tags,
-        'tags_original': original_tags,
-    }
+    return Recommendation(
+        title=entity.get('name'),
+        id=entity.get('id') or entity.get('entity_id'),
+        author=clean_author(entity.get('disambiguation')) if entity.get('disambiguation') else None,
+        publication_date=properties.get('publication_date'),
+        image=properties.get('image'),
+        description=clean_html_text(properties.get('description'), entity.get('id') or entity.get('entity_id')),
+        extra_data={k: v for k, v in extra_data.items() if v},
+        tags=filtered_tags,
+    )
 
 
-def get_qloo_search_recommendations(entity_name, recommendation_fetch_data, page=1):
+async def _search_backup_keywords_concurrently(entity_name, qloo_entity, backup_keywords, location_data, page):
+    """
+    Query the backup keywords concurrently and return the results of the highest priority keyword that has any.
+
+    At most QLOO_BACKUP_FANOUT_CONCURRENCY searches run at once. As soon as the keyword with the
+    highest priority among the remaining ones returns results, the other searches are cancelled.
+    Everything is bounded by QLOO_BACKUP_FANOUT_DEADLINE seconds.
+
+    Args:
+        entity_name (str): The entity name (e.g. 'movies').
+        qloo_entity (str): The Qloo entity URN.
+        backup_keywords (list): The backup keywords in priority order.
+        location_data (dict): Location details for place searches.
+        page (int): The page to fetch.
+
+    Returns:
+        list: The transformed recommendations, empty if no keyword returned any in time.
+    """
+    semaphore = asyncio.Semaphore(QLOO_BACKUP_FANOUT_CONCURRENCY)
+
+    async def search(backup_keyword):
+        async with semaphore:
+            endpoint = get_qloo_search_endpoint(qloo_entity, backup_keyword, location_data, page)
+            data = await make_qloo_request(endpoint)
+            return await transform_batch_async(data.get("results", []), qloo_entity)
+
+    def result_of(task):
+        if task.cancelled() or task.exception() is not None:
+            return []
+        return task.result()
+
+    tasks = [asyncio.create_task(search(backup_keyword)) for backup_keyword in backup_keywords]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + QLOO_BACKUP_FANOUT_DEADLINE
+    next_index = 0
+    pending = set(tasks)
+    try:
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            # Walk the keywords in priority order, only deciding once all higher priority ones are done
+            while next_index < len(tasks) and tasks[next_index].done():
+                recommendation_entities = result_of(tasks[next_index])
+                if recommendation_entities:
+                    print(f"Backup keyword '{backup_keywords[next_index]}' returned {len(recommendation_entities)} recommendations for {entity_name} on page {page}")
+                    return recommendation_entities
+                next_index += 1
+
+        if pending:
+            # Deadline reached, use the best finished keyword if any
+            print(f"Backup keyword search deadline of {QLOO_BACKUP_FANOUT_DEADLINE}s reached for {entity_name} on page {page}")
+        for backup_keyword, task in zip(backup_keywords, tasks):
+            if task.done() and result_of(task):
+                print(f"Backup keyword '{backup_keyword}' returned {len(task.result())} recommendations for {entity_name} on page {page}")
+                return task.result()
+        return []
+    finally:
+        for backup_keyword, task in zip(backup_keywords, tasks):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is not None:
+                print(f"Error searching backup keyword '{backup_keyword}': {task.exception()}")
+
+async def get_qloo_search_recommendations(entity_name, recommendation_fetch_data, page=1):
     qloo_entity = ENTITIES.get(entity_name)
     if not qloo_entity:
         raise ValueError(f"Invalid entity name: {entity_name}")
@@ -460,64 +872,47 @@ def get_qloo_search_recommendations(entity_name, recommendation_fetch_data, page
     endpoint = get_qloo_search_endpoint(qloo_entity, query, location_data, page)
     print(f"Fetching search recommendations from Qloo API for {entity_name} with query '{query}' on page {page} with endpoint {endpoint}")
     
-    data = make_qloo_request(endpoint)
+    data = await make_qloo_request(endpoint)
 
-    
-    recommendation_entities = []
-    if entity_name in ["movies", "tv_shows"]:
-        recommendation_entities += [
-            transform_movie_entity(entity)
-            for entity in data.get("results", [])
-        ]
-    elif entity_name == "books":
-        recommendation_entities += [
-            transform_book_entity(entity)
-            for entity in data.get("results", [])
-        ]
-    elif entity_name in ["destinations", "places"]:
-        recommendation_entities += [
-            transform_place_entity(entity)
-            for entity in data.get("results", [])
-        ]
+    recommendation_entities = await transform_batch_async(data.get("results", []), qloo_entity)
     print(f"Found {len(recommendation_entities)} recommendations for {entity_name} with query '{query}' on page {page}")
     if recommendation_entities == []:
         print(f"No recommendations found for {entity_name} with query '{query}' on page {page}")
         print("Switching to backup keywords")
-        all_backup_keywords = recommendation_fetch_data.get('backup_keywords',"").strip().split(',')
+        all_backup_keywords = []
+        for backup_keyword in (recommendation_fetch_data.get('backup_keywords') or "").split(','):
+            backup_keyword = backup_keyword.strip()
+            if backup_keyword and backup_keyword != query and backup_keyword not in all_backup_keywords:
+                all_backup_keywords.append(backup_keyword)
         if not all_backup_keywords:
             print("No backup keywords found, returning empty list")
             return recommendation_entities
-        backups_checked = 0
-        while recommendation_entities == [] and backups_checked < len(all_backup_keywords):
-            backup_keyword = all_backup_keywords[backups_checked].strip()
-            print(f"Trying backup keyword: {backup_keyword}")
-            endpoint = get_qloo_search_endpoint(qloo_entity, backup_keyword, location_data, page)
-            print(f"Fetching search recommendations from Qloo API for {entity_name} with query '{backup_keyword}' on page {page} with endpoint {endpoint}")
-            data = make_qloo_request(endpoint)
-            if entity_name in ["movies", "tv_shows"]:
-                recommendation_entities += [
-                    transform_movie_entity(entity)
-                    for entity in data.get("results", [])
-                ]
-            elif entity_name == "books":
-                recommendation_entities += [
-                    transform_book_entity(entity)
-                    for entity in data.get("results", [])
-                ]
-            elif entity_name in ["destinations", "places"]:
-                recommendation_entities += [
-                    transform_place_entity(entity)
-                    for entity in data.get("results", [])
-                ]
-            backups_checked += 1
+
+        if QLOO_BACKUP_FANOUT_ENABLED:
+            recommendation_entities = await _search_backup_keywords_concurrently(
+                entity_name, qloo_entity, all_backup_keywords, location_data, page
+            )
+        else:
+            backups_checked = 0
+            while recommendation_entities == [] and backups_checked < len(all_backup_keywords):
+                backup_keyword = all_backup_keywords[backups_checked]
+                endpoint = get_qloo_search_endpoint(qloo_entity, backup_keyword, location_data, page)
+                print(f"Fetching search recommendations from Qloo API for {entity_name} with backup keyword '{backup_keyword}' on page {page} with endpoint {endpoint}")
+                data = await make_qloo_request(endpoint)
+                recommendation_entities = await transform_batch_async(data.get("results", []), qloo_entity)
+                backups_checked += 1
     print(f"Found {len(recommendation_entities)} recommendations for {entity_name} on page {page}")
     return recommendation_entities
 
-def get_qloo_recommendations_by_tag_id(entity_name, tag_id, page, location=None, should_be_recent=False):
+async def get_qloo_recommendations_by_tag_id(entity_name, tag_id, page, location=None, should_be_recent=False):
     qloo_entity = ENTITIES.get(entity_name)
     if not qloo_entity:
         raise ValueError(f"Invalid entity name: {entity_name}")
     
+    # Work on a copy as the same location details can be reused for later pages
+    if location is not None:
+        location = dict(location)
+
     # Remove the location data not needed based on entity type
     if entity_name in ['places', 'destinations']:
         if location is not None:
@@ -537,24 +932,9 @@ def get_qloo_recommendations_by_tag_id(entity_name, tag_id, page, location=None,
                                      radius = location.get('max_radius') if location else None)
     print(f"Fetching recommendations from Qloo API for {entity_name} with tag ID {tag_id} with endpoint {endpoint}")
     
-    data = make_qloo_request(endpoint)
+    data = await make_qloo_request(endpoint)
     
-    recommendation_entities = []
-    if entity_name in ["movies", "tv_shows"]:
-        recommendation_entities += [
-            transform_movie_entity(entity)
-            for entity in data.get("results", {}).get("entities", [])
-        ]
-    elif entity_name == "books":
-        recommendation_entities += [
-            transform_book_entity(entity)
-            for entity in data.get("results", {}).get("entities", [])
-        ]
-    elif entity_name in ["destinations", "places"]:
-        recommendation_entities += [
-            transform_place_entity(entity)
-            for entity in data.get("results", {}).get("entities", [])
-        ]
+    recommendation_entities = await transform_batch_async(data.get("results", {}).get("entities", []), qloo_entity)
     
     print(f"Found {len(recommendation_entities)} recommendations for {entity_name} with tag ID {tag_id} on page {page}")
     return recommendation_entities
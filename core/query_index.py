@@ -0,0 +1,362 @@
+from config import (
+    QUERY_INDEX_ENABLED, QUERY_INDEX_PATH, QUERY_INDEX_THRESHOLD, QUERY_INDEX_DIMENSIONS,
+    QUERY_INDEX_MAX_ENTRIES
+)
+import copy
+import fcntl
+import json
+import os
+import re
+import zlib
+import numpy as np
+from utils import clean_text
+
+# Character n-gram sizes hashed into the message vectors
+NGRAM_SIZES = (3, 4)
+
+# Loaded indexes: recommendation category -> QueryIndex
+_indexes = {}
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "rejected": 0,
+    "added": 0,
+}
+
+def normalize_message(text):
+    # Unlike utils.clean_text, word boundaries are kept so n-grams do not span words
+    return " ".join(re.findall(r'[a-z0-9]+', (text or '').lower()))
+
+def _hash_ngrams(text):
+    """
+    Get the hashed bucket and sign of every character n-gram of a message.
+
+    Returns:
+        tuple: (buckets, signs) lists.
+    """
+    padded = f" {normalize_message(text)} "
+    buckets = []
+    signs = []
+    for size in NGRAM_SIZES:
+        for start in range(len(padded) - size + 1):
+            # crc32 is stable across processes, unlike hash(), so stored vectors stay valid
+            h = zlib.crc32(padded[start:start + size].encode("utf-8"))
+            buckets.append(h % QUERY_INDEX_DIMENSIONS)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+    return buckets, signs
+
+def vectorize(texts):
+    """
+    Turn messages into L2-normalized hashed character n-gram vectors.
+
+    Args:
+        texts (list): The messages.
+
+    Returns:
+        numpy.ndarray: A (len(texts), QUERY_INDEX_DIMENSIONS) float32 matrix.
+    """
+    rows, cols, values = [], [], []
+    for row, text in enumerate(texts):
+        buckets, signs = _hash_ngrams(text)
+        rows.extend([row] * len(buckets))
+        cols.extend(buckets)
+        values.extend(signs)
+    vectors = np.zeros((len(texts), QUERY_INDEX_DIMENSIONS), dtype=np.float32)
+    np.add.at(vectors, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), np.asarray(values, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+# Words that do not change what a message asks for
+FILLER_WORDS = frozenset((
+    'a', 'an', 'the', 'some', 'any', 'few', 'more', 'other', 'me', 'i', 'my', 'we', 'us', 'you', 'can', 'could',
+    'would', 'please', 'want', 'need', 'looking', 'look', 'find', 'give', 'show', 'get', 'recommend',
+    'recommendation', 'rec', 'suggest', 'suggestion', 'idea', 'option', 'for', 'of', 'to', 'with', 'and', 'or',
+    'that', 'which', 'is', 'are', 'be', 'what', 'good', 'great', 'best', 'top', 'nice', 'cool', 'really', 'very',
+))
+
+# Words asking for new or recent recommendations, as listed in the decomposition prompt
+RECENCY_WORDS = frozenset(('new', 'newer', 'newest', 'recent', 'recently', 'latest', 'upcoming', 'current', 'modern'))
+
+def _content_words(text):
+    words = set()
+    for word in normalize_message(text).split():
+        # Plurals ask for the same thing, e.g. "movie" and "movies"
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        if word not in FILLER_WORDS:
+            words.add(word)
+    return words
+
+def has_recency_cue(text):
+    words = normalize_message(text).split()
+    return any(word in RECENCY_WORDS or re.fullmatch(r'(19|20)\d\d', word) for word in words)
+
+def is_compatible(user_message, decomposition, stored_message):
+    """
+    Check that a stored decomposition can be reused for a new message.
+
+    Near-duplicate messages can still differ in what matters most, e.g. "horror movies in
+    Lagos" vs "horror movies in Accra", so the stored location and search term must both
+    appear in the new message. The new message must also ask for recent recommendations
+    exactly when the stored decomposition does. For a specific request (a title, place or
+    dish) both messages must have the same content words, since another title is another
+    request. For a generic one the new message must not add content words, which could
+    make it specific.
+
+    Args:
+        user_message (str): The new message.
+        decomposition (dict): The stored decomposition.
+        stored_message (str): The message the decomposition was made for.
+
+    Returns:
+        bool: True if the decomposition can be reused.
+    """
+    cleaned_message = clean_text(user_message)
+    for field in ('location', 'keyword', 'generic_term'):
+        value = clean_text(decomposition.get(field) or '')
+        if value and value not in cleaned_message:
+            return False
+    if has_recency_cue(user_message) != bool(decomposition.get('should_be_recent')):
+        return False
+    new_words = _content_words(user_message)
+    stored_words = _content_words(stored_message)
+    if decomposition.get('is_specific'):
+        return new_words == stored_words
+    return new_words <= stored_words
+
+class QueryIndex:
+    """
+    Cosine similarity index over the messages of one recommendation category.
+
+    Vectors are kept in one matrix so a lookup is a single matrix-vector product. Once
+    `max_entries` messages are stored it is used as a ring buffer and the oldest message
+    is replaced. Each entry keeps the prompt version of its decomposition and only entries
+    of the current version are matched.
+    """
+
+    def __init__(self, max_entries=QUERY_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.vectors = np.zeros((0, QUERY_INDEX_DIMENSIONS), dtype=np.float32)
+        self.messages = []
+        self.versions = []
+        self.decompositions = []
+        self.next_slot = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def add(self, user_message, prompt_version, decomposition, vector=None):
+        vector = vectorize([user_message]) if vector is None else vector.reshape(1, -1)
+        count = len(self.messages)
+        if count < self.max_entries:
+            if count == len(self.vectors):
+                # Grow the matrix geometrically so adding stays amortized O(1)
+                grown = np.zeros((min(self.max_entries, max(64, count * 2)), QUERY_INDEX_DIMENSIONS), dtype=np.float32)
+                grown[:count] = self.vectors[:count]
+                self.vectors = grown
+            self.vectors[count] = vector[0]
+            self.messages.append(user_message)
+            self.versions.append(prompt_version)
+            self.decompositions.append(decomposition)
+            return
+        slot = self.next_slot
+        self.vectors[slot] = vector[0]
+        self.messages[slot] = user_message
+        self.versions[slot] = prompt_version
+        self.decompositions[slot] = decomposition
+        self.next_slot = (slot + 1) % self.max_entries
+
+    def entries(self):
+        """
+        Iterate over the stored entries, oldest first.
+
+        Yields:
+            tuple: (message, prompt version, decomposition, vector).
+        """
+        count = len(self.messages)
+        order = range(count) if count < self.max_entries else [*range(self.next_slot, count), *range(self.next_slot)]
+        for position in order:
+            yield self.messages[position], self.versions[position], self.decompositions[position], self.vectors[position]
+
+    @classmethod
+    def merge(cls, older, newer):
+        """
+        Merge two indexes of the same category, e.g. the one saved by another worker and this one.
+
+        Messages already in the merged index are skipped, and the newest ones are kept when
+        there are more than max_entries.
+
+        Returns:
+            QueryIndex: The merged index.
+        """
+        merged = cls(max_entries=newer.max_entries)
+        seen = set()
+        for index in (older, newer):
+            for user_message, prompt_version, decomposition, vector in index.entries():
+                key = (normalize_message(user_message), prompt_version)
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.add(user_message, prompt_version, decomposition, vector)
+        return merged
+
+    def query(self, user_message, prompt_version):
+        """
+        Find the most similar stored message of the same prompt version.
+
+        Returns:
+            tuple or None: (similarity, index), None if the index has no entry of the version.
+        """
+        if not self.messages:
+            return None
+        similarities = self.vectors[:len(self.messages)] @ vectorize([user_message])[0]
+        similarities[np.asarray(self.versions) != prompt_version] = -1.0
+        best = int(np.argmax(similarities))
+        if similarities[best] < 0:
+            return None
+        return float(similarities[best]), best
+
+    def to_files(self, path):
+        tmp_vectors_path = f"{path}.tmp.npy"
+        tmp_entries_path = f"{path}.tmp.json"
+        np.save(tmp_vectors_path, self.vectors[:len(self.messages)])
+        with open(tmp_entries_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'messages': self.messages,
+                'versions': self.versions,
+                'decompositions': self.decompositions,
+                'next_slot': self.next_slot,
+            }, f)
+        os.replace(tmp_vectors_path, f"{path}.npy")
+        os.replace(tmp_entries_path, f"{path}.json")
+
+    @classmethod
+    def from_files(cls, path):
+        index = cls()
+        with open(f"{path}.json", 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        vectors = np.load(f"{path}.npy")
+        if vectors.shape != (len(entries['messages']), QUERY_INDEX_DIMENSIONS):
+            # Built with other dimensions, the vectors cannot be compared to new ones
+            vectors = vectorize(entries['messages'])
+        keep = slice(-index.max_entries, None)
+        index.vectors = np.ascontiguousarray(vectors[keep], dtype=np.float32)
+        index.messages = entries['messages'][keep]
+        index.versions = entries['versions'][keep]
+        index.decompositions = entries['decompositions'][keep]
+        index.next_slot = entries.get('next_slot', 0) % index.max_entries if len(index.messages) == index.max_entries else 0
+        return index
+
+def get_index_file_path(recommendation_category):
+    return os.path.join(QUERY_INDEX_PATH, recommendation_category)
+
+def load_query_indexes():
+    """
+    Load the stored query indexes from disk.
+
+    Returns:
+        dict: The number of messages loaded per recommendation category.
+    """
+    loaded = {}
+    if not QUERY_INDEX_ENABLED or not os.path.isdir(QUERY_INDEX_PATH):
+        return loaded
+    for file_name in os.listdir(QUERY_INDEX_PATH):
+        if not file_name.endswith(".json") or file_name.endswith(".tmp.json"):
+            continue
+        recommendation_category = file_name[:-len(".json")]
+        try:
+            _indexes[recommendation_category] = QueryIndex.from_files(get_index_file_path(recommendation_category))
+            loaded[recommendation_category] = len(_indexes[recommendation_category])
+        except Exception as e:
+            print(f"Error loading query index for {recommendation_category}: {e}")
+    print(f"Query indexes loaded: {loaded}")
+    return loaded
+
+def save_query_indexes():
+    """
+    Store the query indexes on disk so they survive restarts, merged with the ones saved by other workers.
+
+    Returns:
+        None
+    """
+    if not QUERY_INDEX_ENABLED or not _indexes:
+        return
+    os.makedirs(QUERY_INDEX_PATH, exist_ok=True)
+    # Every worker saves to the same files, so each one merges in what the others saved
+    with open(os.path.join(QUERY_INDEX_PATH, ".lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        for recommendation_category, index in list(_indexes.items()):
+            path = get_index_file_path(recommendation_category)
+            try:
+                if os.path.exists(f"{path}.json"):
+                    index = QueryIndex.merge(QueryIndex.from_files(path), index)
+                    _indexes[recommendation_category] = index
+                index.to_files(path)
+            except Exception as e:
+                print(f"Error saving query index for {recommendation_category}: {e}")
+
+def find_similar_decomposition(recommendation_category, prompt_version, user_message):
+    """
+    Find the decomposition of a stored message similar enough to reuse for a new one.
+
+    Args:
+        recommendation_category (str): The category of recommendations.
+        prompt_version (str): The version of the decomposition prompt.
+        user_message (str): The new message.
+
+    Returns:
+        dict or None: A copy of the stored decomposition, None if there is no close enough compatible match.
+    """
+    if not QUERY_INDEX_ENABLED:
+        return None
+    index = _indexes.get(recommendation_category)
+    match = index.query(user_message, prompt_version) if index is not None else None
+    if match is None or match[0] < QUERY_INDEX_THRESHOLD:
+        _stats["misses"] += 1
+        return None
+    similarity, position = match
+    decomposition = index.decompositions[position]
+    if not is_compatible(user_message, decomposition, index.messages[position]):
+        _stats["rejected"] += 1
+        return None
+    _stats["hits"] += 1
+    print(f"Reusing decomposition of '{index.messages[position]}' for '{user_message}' (similarity {similarity:.3f})")
+    return copy.deepcopy(decomposition)
+
+def add_decomposition(recommendation_category, prompt_version, user_message, decomposition):
+    """
+    Store the decomposition of a message in the index of its category.
+
+    Args:
+        recommendation_category (str): The category of recommendations.
+        prompt_version (str): The version of the decomposition prompt.
+        user_message (str): The message.
+        decomposition (dict): The decomposition result.
+
+    Returns:
+        None
+    """
+    if not QUERY_INDEX_ENABLED or not normalize_message(user_message):
+        return
+    index = _indexes.get(recommendation_category)
+    if index is None:
+        index = _indexes[recommendation_category] = QueryIndex()
+    index.add(user_message, prompt_version, copy.deepcopy(decomposition))
+    _stats["added"] += 1
+
+def get_query_index_stats():
+    """
+    Get the query index counters.
+
+    Returns:
+        dict: The counters along with the number of messages per category and the hit rate.
+    """
+    lookups = _stats["hits"] + _stats["misses"] + _stats["rejected"]
+    return {
+        **_stats,
+        "entries": {recommendation_category: len(index) for recommendation_category, index in _indexes.items()},
+        "threshold": QUERY_INDEX_THRESHOLD,
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
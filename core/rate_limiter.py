@@ -0,0 +1,142 @@
+from collections import deque
+import asyncio
+import time
+
+class TokenBucket:
+    """
+    Token bucket limiting how many requests start per second.
+
+    `rate` tokens are added per second up to `burst`; each request takes one. The bucket
+    can also be paused, e.g. when the upstream API returns a Retry-After.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return now
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it.
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            now = self._refill()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """
+        Stop handing out tokens for the given number of seconds.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def get_stats(self):
+        self._refill()
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+        }
+
+
+class AIMDLimiter:
+    """
+    Concurrency limiter that adapts with additive increase / multiplicative decrease.
+
+    Each successful call raises the limit by `increase / limit` (about `increase` per full
+    window of calls). A call that signals overload (throttling, server errors, timeouts)
+    multiplies the limit by `decrease_factor`, at most once per `decrease_cooldown` seconds
+    so one burst of failures does not collapse the limit to the minimum.
+    """
+
+    SUCCESS = "success"
+    OVERLOAD = "overload"
+    IGNORE = "ignore"
+
+    def __init__(self, initial_limit, min_limit, max_limit, increase=1.0, decrease_factor=0.5, decrease_cooldown=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease_at = 0.0
+        self._stats = {"successes": 0, "overloads": 0, "decreases": 0}
+
+    async def acquire(self):
+        """
+        Wait for a free concurrency slot. Every acquire must be paired with a release.
+        """
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation, give it back
+                self.release(self.IGNORE)
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self, outcome):
+        """
+        Free a concurrency slot and adapt the limit to the outcome of the call.
+
+        Args:
+            outcome (str): SUCCESS, OVERLOAD or IGNORE (for outcomes that say nothing about upstream load).
+        """
+        self.in_flight -= 1
+        if outcome == self.SUCCESS:
+            self._stats["successes"] += 1
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+        elif outcome == self.OVERLOAD:
+            self._stats["overloads"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease_at >= self.decrease_cooldown:
+                self._last_decrease_at = now
+                self._stats["decreases"] += 1
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def get_stats(self):
+        return {
+            **self._stats,
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+        }
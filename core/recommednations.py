@@ -1,10 +1,12 @@
-from core import qloo_core, llm_core
+from core import qloo_core, llm_core, llm_telemetry, prefetch, enrichment_cache, pre_ranker
 import asyncio
 import random
 from utils import dict_to_string, get_all_location_details, clean_text
-from db import add_recommendation, get_recommendations_using_details, set_session_status_field, get_session_status_field
+from db import add_recommendation, get_recommendations_using_details, set_session_status_field, get_session_status_field, get_session_status_fields, memoize_session_fields
 from traceback import format_exc
+from config import LLM_BATCH_ENRICHMENT, LLM_STREAMING_ENRICHMENT, RECOMMENDATION_COUNTER_ENABLED
 
+@memoize_session_fields
 async def generate_qloo_powered_recommendations(session_id, recommendation_category = "Movies", user_message=None, is_tags_only=False, selected_tag_id=None):
     """
     Get recommendations powered by Qloo based on user preferences.
@@ -16,19 +18,24 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
     # Use model to add a context on how the recommendation is a good fit for the user
     print(f"Generating recommendations for session {session_id} in category {recommendation_category} with user message: {user_message} and is_tags_only: {is_tags_only} and selected_tag_id: {selected_tag_id}")
 
-    processing_status = await asyncio.to_thread(get_session_status_field,
+    # Read the fields of this message used below along with the processing status
+    session_fields = await get_session_status_fields(
         session_id,
         recommendation_category,
         user_message,
         selected_tag_id,
-        field_key='is_processing'
+        ['is_processing', 'recommendation_fetch_details', 'page']
     )
+    processing_status = session_fields['is_processing']
     print(f"Processing status for session {session_id}: {processing_status}")
     if processing_status and processing_status is True:
         return
+
+    # Collect the LLM calls of this request, including those of the enrichment task started below
+    llm_telemetry.start_request_summary(f"session {session_id} in category {recommendation_category}")
     
     # Set the session processing status to True
-    asyncio.create_task(asyncio.to_thread(set_session_status_field,
+    asyncio.create_task(set_session_status_field(
         session_id,
         recommendation_category,
         user_message,
@@ -42,18 +49,14 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
     last_location_details = None
     should_be_recent = False
     fresh_recommendation_details = False
+    # What the user asked for, used to pre-rank the candidates before LLM scoring
+    rank_details = {}
     try:
         if is_tags_only == False:
 
             # Get recommendation data from user message
             # Try if we have it in the session data first
-            recommendation_fetch_data = await asyncio.to_thread(get_session_status_field,
-                session_id,
-                recommendation_category,
-                user_message,
-                selected_tag_id,
-                field_key='recommendation_fetch_details'
-            )
+            recommendation_fetch_data = session_fields['recommendation_fetch_details']
             if not recommendation_fetch_data:
                 # If not found, then we can use the LLM to get the recommendation data from the user message
                 print(f"Recommendation fetch data not found in session data for session {session_id}, using LLM to get it from user message.")
@@ -82,7 +85,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                 location_detils = await asyncio.to_thread(get_all_location_details, recommendation_fetch_data_for_user_message['location'], country_level=qloo_core.is_country_level(recommendation_category))
                 recommendation_fetch_data_for_user_message['location_details'] = location_detils
                 # To enable us get last location details for a session, we can set the location details in the session data
-                asyncio.create_task(asyncio.to_thread(set_session_status_field,
+                asyncio.create_task(set_session_status_field(
                     session_id,
                     recommendation_category,
                     None,
@@ -90,9 +93,16 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                     field_key='last_location_details',
                     field_value=recommendation_fetch_data_for_user_message.get('location_details', {})
                 ))
+
+            # Built after the location details of a fresh decomposition are fetched, so the first page is ranked by distance too
+            rank_details = {
+                'keyword': recommendation_fetch_data_for_user_message.get('keyword') or recommendation_fetch_data_for_user_message.get('generic_term'),
+                'should_be_recent': recommendation_fetch_data_for_user_message.get('should_be_recent', False),
+                'location_details': recommendation_fetch_data_for_user_message.get('location_details'),
+            }
             
             # Update the session data with the recommendation fetch data
-            asyncio.create_task(asyncio.to_thread(set_session_status_field,
+            asyncio.create_task(set_session_status_field(
                 session_id,
                 recommendation_category,
                 user_message,
@@ -103,26 +113,35 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
 
             #Page tracking
             page_to_use = 1
-            current_page = await asyncio.to_thread(get_session_status_field,
-                                                session_id,
-                                                recommendation_category,
-                                                user_message,
-                                                selected_tag_id,
-                                                field_key='page')
+            current_page = session_fields['page']
             if current_page:
                 page_to_use = current_page + 1
             
             
             # 3rd get recommendations from Qloo API based on the data
             if recommendation_fetch_data_for_user_message.get('is_specific', False) == True:
-                recommendations = await asyncio.to_thread(qloo_core.get_qloo_search_recommendations,
-                    recommendation_category, 
-                    recommendation_fetch_data_for_user_message, 
-                    page=page_to_use
-                    )
+                search_query_key = prefetch.get_query_key(session_id, recommendation_category, user_message, selected_tag_id)
+                recommendations = await prefetch.take_prefetched(search_query_key, page_to_use)
+                if recommendations is None:
+                    recommendations = await qloo_core.get_qloo_search_recommendations(
+                        recommendation_category, 
+                        recommendation_fetch_data_for_user_message, 
+                        page=page_to_use
+                        )
+                else:
+                    print(f"Using prefetched page {page_to_use} for session {session_id} in category {recommendation_category}")
+
+                if recommendations:
+                    # Fetch the next page(s) while this one is being enriched
+                    search_fetch_data = recommendation_fetch_data_for_user_message
+                    prefetch.schedule_prefetch(search_query_key, page_to_use + 1, lambda page: qloo_core.get_qloo_search_recommendations(
+                        recommendation_category,
+                        search_fetch_data,
+                        page=page
+                    ))
 
                 #Update page tracking for this message in the database
-                asyncio.create_task(asyncio.to_thread(set_session_status_field,
+                asyncio.create_task(set_session_status_field(
                     session_id,
                     recommendation_category,
                     user_message,
@@ -134,7 +153,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                 # If the message is not specific, we can use the generic term to get a tag to use for recommendations
 
                 # First check if we have a tag to use for the recommendation
-                possible_tag_switched_id = await asyncio.to_thread(get_session_status_field,
+                possible_tag_switched_id = await get_session_status_field(
                     session_id,
                     recommendation_category,
                     user_message,
@@ -142,7 +161,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                     field_key='tag_switched_id'
                 )
                 if possible_tag_switched_id is None:
-                    tag_to_use = await asyncio.to_thread(qloo_core.get_qloo_tag_to_use_for_non_specific,
+                    tag_to_use = await qloo_core.get_qloo_tag_to_use_for_non_specific(
                         recommendation_category, 
                         recommendation_fetch_data_for_user_message.get('generic_term', None),
                         backups=recommendation_fetch_data_for_user_message.get('backup_keywords', None)
@@ -157,7 +176,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                     selected_tag_id = tag_to_use
                 last_location_details = recommendation_fetch_data_for_user_message.get('location_details', {})
                 should_be_recent = recommendation_fetch_data_for_user_message.get('should_be_recent', False)
-                asyncio.create_task(asyncio.to_thread(set_session_status_field,
+                asyncio.create_task(set_session_status_field(
                     session_id,
                     recommendation_category,
                     user_message,
@@ -172,7 +191,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
             # If its not, we only need to add location details if the recommendation category is not country level as country level is used to denote those categories that ideally do not need country unless specified (movies, books) so the opposite of that is what we need to check
             if last_location_details is None and qloo_core.is_country_level(recommendation_category) == False:
                 # Get the last location details from the session data
-                last_location_details = await asyncio.to_thread(get_session_status_field,
+                last_location_details = await get_session_status_field(
                     session_id,
                     recommendation_category,
                     None,
@@ -181,7 +200,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                 )
             print(f"Last location details for session {session_id}: {last_location_details}")
             page_to_use = 1
-            current_page = await asyncio.to_thread(get_session_status_field,
+            current_page = await get_session_status_field(
                                                 session_id,
                                                 recommendation_category,
                                                 user_message,
@@ -189,14 +208,32 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                                                 field_key='page')
             if current_page:
                 page_to_use = current_page + 1
-            recommendations = await asyncio.to_thread(qloo_core.get_qloo_recommendations_by_tag_id, 
-                                                    recommendation_category, 
-                                                    selected_tag_id,
-                                                    page=page_to_use,
-                                                    location = last_location_details if last_location_details else None,
-                                                    should_be_recent=should_be_recent
-                                                    )
-            asyncio.create_task(asyncio.to_thread(set_session_status_field,
+            tag_query_key = prefetch.get_query_key(session_id, recommendation_category, user_message, selected_tag_id)
+            recommendations = await prefetch.take_prefetched(tag_query_key, page_to_use)
+            if recommendations is None:
+                recommendations = await qloo_core.get_qloo_recommendations_by_tag_id(
+                                                        recommendation_category, 
+                                                        selected_tag_id,
+                                                        page=page_to_use,
+                                                        location = last_location_details if last_location_details else None,
+                                                        should_be_recent=should_be_recent
+                                                        )
+            else:
+                print(f"Using prefetched page {page_to_use} for session {session_id} in category {recommendation_category} with tag ID {selected_tag_id}")
+
+            if recommendations:
+                # Fetch the next page(s) while this one is being enriched
+                tag_to_prefetch = selected_tag_id
+                location_to_prefetch = last_location_details if last_location_details else None
+                recent_to_prefetch = should_be_recent
+                prefetch.schedule_prefetch(tag_query_key, page_to_use + 1, lambda page: qloo_core.get_qloo_recommendations_by_tag_id(
+                    recommendation_category,
+                    tag_to_prefetch,
+                    page=page,
+                    location=location_to_prefetch,
+                    should_be_recent=recent_to_prefetch
+                ))
+            asyncio.create_task(set_session_status_field(
                 session_id,
                 recommendation_category,
                 user_message,
@@ -213,14 +250,17 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                 recommendations = recommendations,
                 tag_id = selected_tag_id,
                 pseudo_query = f"The user is looking for recommendations based on the selected tag - {selected_tag_id or 'None'}",
-                message_converted_to_tag = message_converted_to_tag
+                message_converted_to_tag = message_converted_to_tag,
+                keyword = rank_details.get('keyword'),
+                should_be_recent = rank_details.get('should_be_recent', should_be_recent),
+                location_details = last_location_details or rank_details.get('location_details')
             ))
         else:
             print(f"No recommendations found for session {session_id} in category {recommendation_category} with user message: {user_message} and selected tag ID: {selected_tag_id}")
             raise Exception("show_user: No recommendations found for the given criteria. Please try again with different Message or Tag")
     except Exception as e:
         print(f"Error generating recommendations: {e}")
-        asyncio.create_task(asyncio.to_thread(set_session_status_field,
+        asyncio.create_task(set_session_status_field(
             session_id,
             recommendation_category,
             user_message,
@@ -231,7 +271,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
         if message_converted_to_tag:
             # If the message was converted to a tag, we need to set upper level processing status to False
             # This is to ensure that the session is not marked as processing for the user message
-            asyncio.create_task(asyncio.to_thread(set_session_status_field,
+            asyncio.create_task(set_session_status_field(
                 session_id,
                 recommendation_category,
                 user_message,
@@ -243,7 +283,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
         # Add the error to error field of the session 
         if 'show_user' in str(e):
             # If the error has 'show_user' in it, we can set the error message to be shown to the user
-            asyncio.create_task(asyncio.to_thread(set_session_status_field,
+            asyncio.create_task(set_session_status_field(
                 session_id,
                 recommendation_category,
                 user_message,
@@ -253,7 +293,7 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
             ))
         else:
             # If the error does not have 'show_user' in it, then its a techinal one to set to technical_error field
-            asyncio.create_task(asyncio.to_thread(set_session_status_field,
+            asyncio.create_task(set_session_status_field(
                 session_id,
                 recommendation_category,
                 user_message,
@@ -262,10 +302,14 @@ async def generate_qloo_powered_recommendations(session_id, recommendation_categ
                 field_value=str(e)
             ))
         print(f"Error generating recommendations: {format_exc()}")
+        llm_telemetry.finish_request_summary()
 
-async def enrich_and_save_recommendations(session_id, rec_category,recommendations, user_query = None, tag_id = None, pseudo_query=None, message_converted_to_tag=False):
+async def enrich_and_save_recommendations(session_id, rec_category,recommendations, user_query = None, tag_id = None, pseudo_query=None, message_converted_to_tag=False, keyword=None, should_be_recent=False, location_details=None):
     """
     Enrich the recommendations with additional data and save them to the database.
+
+    keyword, should_be_recent and location_details describe what the user asked for and are
+    used to pre-rank the recommendations, so only the most relevant ones are scored by the LLM.
     """
     original_query = user_query
     if message_converted_to_tag:
@@ -275,48 +319,103 @@ async def enrich_and_save_recommendations(session_id, rec_category,recommendatio
             """
             original_query = user_query
             user_query = None
+    async def save_recommendation(rec, context_and_score):
+        try:
+            if not context_and_score:
+                print(f"No context and score found for recommendation {rec.title or 'Unknown'}")
+                return None
+            context_text = context_and_score.get('context', '')
+            score = context_and_score.get('score', 0)
+            if score > llm_core.MIN_PASSING_SCORE:
+                rec.context = context_text
+                rec.score = score
+                rec.extra_data_string = dict_to_string(rec.extra_data, normalize_text=True)
+                rec.session_id = session_id
+                rec.user_message = original_query
+                rec.cleaned_user_message = clean_text(original_query)
+                rec.recommendation_category = rec_category
+                rec.tag_id = tag_id
+
+                # Now save the recommendation to the database
+                await add_recommendation(rec)
+                print(f"Recommendation saved: {rec.title} with context: {context_text[:300]} and score: {score}")
+            else:
+                print(f"Recommendation skipped due to low score: {score} for {rec.title}")
+        except Exception as e:
+            print(f"Error saving recommendation {rec.title or 'Unknown'}: {e}")
+            return None
+
     # Get the model to generate context for the recommendations
-    def enrich_recommendation(rec):
-        # copy the recommendation to avoid modifying the original
+    async def enrich_recommendation(rec, cache_key):
         try:
-            rec_ = rec.copy()
-            if 'error' not in rec_:
-                rec_['tags_original'] = None
-                context_and_score = llm_core.get_context_and_score_for_recommndation_text(
-                    rec_, user_message=user_query or pseudo_query
+            if LLM_STREAMING_ENRICHMENT:
+                context_and_score = await llm_core.get_context_and_score_for_recommendation_streamed(
+                    rec.to_prompt_dict(), user_message=user_query or pseudo_query, recommendation_category=rec_category
+                )
+            else:
+                context_and_score = await llm_core.get_context_and_score_for_recommndation_text(
+                    rec.to_prompt_dict(), user_message=user_query or pseudo_query, recommendation_category=rec_category
                 )
-                if not context_and_score:
-                    print(f"No context and score found for recommendation {rec.get('title', 'Unknown')}")
-                    return None
-                context_text = context_and_score.get('context', '')
-                score = context_and_score.get('score', 0)
-                if score > 5:
-                    rec['context'] = context_text
-                    rec['extra_data_string'] = dict_to_string(rec.get('extra_data', {}), normalize_text=True)
-            
-                    # Now save the recommendation to the database
-                    add_recommendation(
-                        {
-                            **rec,
-                            'session_id': session_id,
-                            'user_message': original_query,
-                            'cleaned_user_message': clean_text(original_query),
-                            'recommendation_category': rec_category,
-                            'tag_id': tag_id,
-                        }
-                    )
-                    print(f"Recommendation saved: {rec['title']} with context: {context_text[:300]} and score: {score}")
-                else:
-                    print(f"Recommendation skipped due to low score: {score} for {rec['title']}")
         except Exception as e:
-            print(f"Error enriching recommendation {rec.get('title', 'Unknown')}: {e}")
+            print(f"Error enriching recommendation {rec.title or 'Unknown'}: {e}")
             return None
-    
-    recommendations = await asyncio.gather(*[
-        asyncio.to_thread(enrich_recommendation, rec) for rec in recommendations if rec
-    ])
+        if cache_key and context_and_score:
+            await enrichment_cache.set_cached_enrichments({cache_key: context_and_score})
+        await save_recommendation(rec, context_and_score)
 
-    set_session_status_field(
+    recommendations = [rec for rec in recommendations if rec]
+    candidate_count = len(recommendations)
+    recommendations = pre_ranker.select_candidates(
+        rec_category,
+        recommendations,
+        tag_id=tag_id,
+        keyword=keyword,
+        should_be_recent=should_be_recent,
+        location_details=location_details
+    )
+    if len(recommendations) < candidate_count:
+        print(f"Pre-ranking kept {len(recommendations)} of {candidate_count} recommendations for LLM scoring")
+
+    # Recommendations already scored for the same intent are not sent to the LLM again
+    cache_keys = [
+        enrichment_cache.get_cache_key(rec.id, user_query=user_query, tag_id=tag_id, original_query=original_query)
+        for rec in recommendations
+    ]
+    cached_contexts_and_scores = await enrichment_cache.get_cached_enrichments([key for key in cache_keys if key])
+    to_score = []
+    cached_saves = []
+    for rec, cache_key in zip(recommendations, cache_keys):
+        if cache_key in cached_contexts_and_scores:
+            cached_saves.append(save_recommendation(rec, cached_contexts_and_scores[cache_key]))
+        else:
+            to_score.append((rec, cache_key))
+    if cached_saves:
+        print(f"Using cached context and score for {len(cached_saves)} of {len(recommendations)} recommendations")
+        await asyncio.gather(*cached_saves)
+
+    if to_score and LLM_BATCH_ENRICHMENT and not LLM_STREAMING_ENRICHMENT:
+        # Score the page a few recommendations per LLM call
+        try:
+            contexts_and_scores = await llm_core.get_context_and_score_for_recommendations_batched(
+                [rec.to_prompt_dict() for rec, _ in to_score], user_message=user_query or pseudo_query, recommendation_category=rec_category
+            )
+        except Exception as e:
+            print(f"Error enriching recommendations in batches: {e}")
+            contexts_and_scores = [None] * len(to_score)
+        await enrichment_cache.set_cached_enrichments({
+            cache_key: context_and_score
+            for (_, cache_key), context_and_score in zip(to_score, contexts_and_scores)
+            if cache_key and context_and_score
+        })
+        await asyncio.gather(*[
+            save_recommendation(rec, context_and_score) for (rec, _), context_and_score in zip(to_score, contexts_and_scores)
+        ])
+    elif to_score:
+        await asyncio.gather(*[
+            enrich_recommendation(rec, cache_key) for rec, cache_key in to_score
+        ])
+
+    await set_session_status_field(
         session_id,
         rec_category,
         original_query,
@@ -327,7 +426,7 @@ async def enrich_and_save_recommendations(session_id, rec_category,recommendatio
     if message_converted_to_tag:
         # If the message was converted to a tag, we need to set upper level processing status to False
         # This is to ensure that the session is not marked as processing for the user message
-        set_session_status_field(
+        await set_session_status_field(
             session_id,
             rec_category,
             original_query,
@@ -336,14 +435,18 @@ async def enrich_and_save_recommendations(session_id, rec_category,recommendatio
             field_value=False
         )
 
+    llm_telemetry.finish_request_summary()
     print(f"Enrichment and saving of recommendations completed for session {session_id} in category {rec_category} with user query: {user_query} and tag ID: {tag_id}")
 
-async def get_recommendations_by_details(details, page=1):
+@memoize_session_fields
+async def get_recommendations_by_details(details, page=1, cursor=None):
     """
     Fetch recommendations based on the provided details.
     
     Args:
         details (dict): A dictionary containing the details to filter recommendations.
+        page (int): The page number, used when there is no cursor.
+        cursor (str, optional): The next_cursor of the previous page.
     
     Returns:
         list: A list of recommendations based on the provided details.
@@ -353,36 +456,36 @@ async def get_recommendations_by_details(details, page=1):
     
     # print(f"Fetching recommendations by details: {details} on page {page}")
     
-    processing_status = await asyncio.to_thread(get_session_status_field,
+    field_keys = ['is_processing', 'tag_switched_id', 'error_message']
+    if RECOMMENDATION_COUNTER_ENABLED:
+        field_keys.append('recommendation_count')
+    session_fields = await get_session_status_fields(
         details.get('session_id'),
         details.get('recommendation_category'),
         details.get('user_message'),
         details.get('tag_id'),
-        field_key='is_processing'
+        field_keys
     )
+    processing_status = session_fields['is_processing']
     print(f"Processing status for session {details.get('session_id')}: {processing_status}")
 
-    possible_tag_switched_id = await asyncio.to_thread(get_session_status_field,
-        details.get('session_id'),
-        details.get('recommendation_category'),
-        details.get('user_message'),
-        details.get('tag_id'),
-        field_key='tag_switched_id'
-    )
-
+    possible_tag_switched_id = session_fields['tag_switched_id']
     if possible_tag_switched_id is not None:
         print(f"Possible tag switched ID for session {details.get('session_id')}: {possible_tag_switched_id}")
         details['tag_id'] = possible_tag_switched_id
-    
-    error_message = await asyncio.to_thread(get_session_status_field,
-        details.get('session_id'),
-        details.get('recommendation_category'),
-        details.get('user_message'),
-        details.get('tag_id'),
-        field_key='error_message'
-    )
+        # The error message and count are kept under the switched tag
+        session_fields = await get_session_status_fields(
+            details.get('session_id'),
+            details.get('recommendation_category'),
+            details.get('user_message'),
+            details.get('tag_id'),
+            field_keys[2:]
+        )
+
+    error_message = session_fields['error_message']
+    total_recommendations = session_fields.get('recommendation_count')
 
-    recommendations = await asyncio.to_thread(get_recommendations_using_details,details=details, page=page)
+    recommendations = await get_recommendations_using_details(details=details, page=page, cursor=cursor, total_recommendations=total_recommendations)
     # print(f"Recommendations fetched for session {details.get('session_id')}: {recommendations}")
 
     if recommendations and recommendations != {} and recommendations.get('start_next_set', False) == True:
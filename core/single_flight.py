@@ -0,0 +1,88 @@
+from config import SINGLE_FLIGHT_MAX_TRACKED_KEYS
+from collections import OrderedDict
+import asyncio
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    Callers that ask for a key while a call for that key is already in flight await the
+    same result instead of starting another call. The shared call keeps running even if
+    the caller that started it is cancelled, as other callers may still be waiting on it.
+    """
+
+    def __init__(self, name, max_tracked_keys=SINGLE_FLIGHT_MAX_TRACKED_KEYS):
+        self.name = name
+        self.max_tracked_keys = max_tracked_keys
+        self._in_flight = {}
+        # Per-key counters in LRU order so the number of tracked keys stays bounded
+        self._key_stats = OrderedDict()
+        self.calls = 0
+        self.collapsed = 0
+
+    def _on_done(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved, the callers still get it through the shield
+            task.exception()
+
+    def _record(self, key, collapsed):
+        key_stats = self._key_stats.get(key)
+        if key_stats is None:
+            key_stats = self._key_stats[key] = {"calls": 0, "collapsed": 0}
+        self._key_stats.move_to_end(key)
+        key_stats["calls"] += 1
+        self.calls += 1
+        if collapsed:
+            key_stats["collapsed"] += 1
+            self.collapsed += 1
+        while len(self._key_stats) > self.max_tracked_keys:
+            self._key_stats.popitem(last=False)
+
+    def is_in_flight(self, key):
+        """
+        Check whether a call with the given key is in flight, i.e. whether `run` would join it.
+        """
+        return key in self._in_flight
+
+    async def run(self, key, coroutine_function, *args, **kwargs):
+        """
+        Run `coroutine_function(*args, **kwargs)` unless a call with the same key is already in flight.
+
+        Args:
+            key (hashable): The canonical key of the call.
+            coroutine_function (callable): The coroutine function doing the actual work.
+
+        Returns:
+            Any: The result of the shared call.
+        """
+        task = self._in_flight.get(key)
+        self._record(key, collapsed=task is not None)
+        if task is None:
+            task = asyncio.create_task(coroutine_function(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task)
+
+    def get_stats(self, top=20):
+        """
+        Get the single-flight counters.
+
+        Args:
+            top (int): The number of keys with the most collapsed calls to include.
+
+        Returns:
+            dict: Total and per-key counters.
+        """
+        top_keys = sorted(
+            ((key, key_stats) for key, key_stats in self._key_stats.items() if key_stats["collapsed"] > 0),
+            key=lambda item: item[1]["collapsed"],
+            reverse=True
+        )[:top]
+        return {
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._in_flight),
+            "top_collapsed_keys": [{"key": str(key), **key_stats} for key, key_stats in top_keys],
+        }
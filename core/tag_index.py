@@ -0,0 +1,194 @@
+from config import TAG_INDEX_ENABLED, TAG_INDEX_PATH, TAG_INDEX_TYPO_CUTOFF, TAG_INDEX_MAX_PAGES, QLOO_API_URL
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import re
+
+# Entity types that get a local tag index, keyed the same way as qloo_core.ENTITIES
+INDEXED_ENTITIES = ['movies', 'tv_shows', 'books', 'places']
+
+# Loaded indexes: entity name -> TagIndex
+_indexes = {}
+
+def tokenize(text):
+    # Same normalization as qloo_core.loosely_matches
+    return frozenset(re.findall(r'\w+', text.lower()))
+
+class TagIndex:
+    """
+    In-memory lookup structure over the Qloo tags of one entity type.
+
+    Tags are kept in the order Qloo returned them so lookups respect Qloo's own ranking.
+    """
+
+    def __init__(self, tags):
+        self.tags = []
+        self.by_name = {}
+        self.by_token = {}
+        self.token_sets = []
+        for tag in tags:
+            name = (tag.get('name') or '').strip().lower()
+            tag_id = tag.get('id') or tag.get('tag_id')
+            if not name or not tag_id:
+                continue
+            idx = len(self.tags)
+            self.tags.append({'id': tag_id, 'name': tag.get('name'), 'type': tag.get('type', '')})
+            self.by_name.setdefault(name, []).append(idx)
+            tokens = tokenize(name)
+            self.token_sets.append(tokens)
+            for token in tokens:
+                self.by_token.setdefault(token, set()).add(idx)
+        self.names = list(self.by_name.keys())
+
+    def __len__(self):
+        return len(self.tags)
+
+    def lookup(self, query, limit=10):
+        """
+        Find the tags matching a query, best matches first.
+
+        Exact name matches come first, then tags whose tokens are a subset of the query
+        tokens (or the other way round), then typo-tolerant name matches.
+
+        Args:
+            query (str): The generic term to look up.
+            limit (int): The maximum number of tags to return.
+
+        Returns:
+            list: The matching tags as dictionaries with 'id', 'name' and 'type'.
+        """
+        query = (query or '').strip().lower()
+        if not query:
+            return []
+
+        seen = set()
+        ordered = []
+
+        def add(indices):
+            for idx in sorted(indices):
+                if idx not in seen:
+                    seen.add(idx)
+                    ordered.append(idx)
+
+        add(self.by_name.get(query, []))
+
+        query_tokens = tokenize(query)
+        if query_tokens:
+            postings = [self.by_token.get(token, set()) for token in query_tokens]
+            # Query tokens are a subset of the tag tokens
+            add(set.intersection(*postings))
+            # Tag tokens are a subset of the query tokens
+            add(idx for idx in set().union(*postings) if self.token_sets[idx] <= query_tokens)
+
+        if len(ordered) < limit:
+            for name in difflib.get_close_matches(query, self.names, n=limit, cutoff=TAG_INDEX_TYPO_CUTOFF):
+                add(self.by_name[name])
+
+        return [self.tags[idx] for idx in ordered[:limit]]
+
+def get_index_file_path(entity_name):
+    return os.path.join(TAG_INDEX_PATH, f"{entity_name}.json")
+
+def load_tag_indexes():
+    """
+    Load the stored tag indexes from disk. Missing files are skipped.
+
+    Returns:
+        dict: The number of tags loaded per entity name.
+    """
+    loaded = {}
+    if not TAG_INDEX_ENABLED:
+        return loaded
+    for entity_name in INDEXED_ENTITIES:
+        path = get_index_file_path(entity_name)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                tags = json.load(f)
+            _indexes[entity_name] = TagIndex(tags)
+            loaded[entity_name] = len(_indexes[entity_name])
+        except Exception as e:
+            print(f"Error loading tag index for {entity_name}: {e}")
+    print(f"Tag indexes loaded: {loaded}")
+    return loaded
+
+def lookup_tags(entity_name, query, limit=10):
+    """
+    Look up the tags matching a query in the local index of an entity type.
+
+    Args:
+        entity_name (str): The entity name (e.g. 'movies').
+        query (str): The generic term to look up.
+        limit (int): The maximum number of tags to return.
+
+    Returns:
+        list: The matching tags, empty if there is no index or no match.
+    """
+    index = _indexes.get(entity_name)
+    if index is None:
+        return []
+    return index.lookup(query, limit=limit)
+
+def get_qloo_tags_list_endpoint(entity, page, take):
+    return f"{QLOO_API_URL}v2/tags?filter.parents.types={entity}&take={take}&page={page}"
+
+async def refresh_tag_index(entity_name, take=50, max_pages=TAG_INDEX_MAX_PAGES):
+    """
+    Page through the Qloo tags of an entity type and store them as the local index.
+
+    Args:
+        entity_name (str): The entity name (e.g. 'movies').
+        take (int): Tags to request per page.
+        max_pages (int): The maximum number of pages to fetch.
+
+    Returns:
+        int: The number of tags stored.
+    """
+    # Imported here as qloo_core itself depends on this module
+    from core import qloo_core
+
+    qloo_entity = qloo_core.ENTITIES.get(entity_name)
+    if not qloo_entity:
+        raise ValueError(f"Invalid entity name: {entity_name}")
+
+    tags = []
+    seen_ids = set()
+    for page in range(1, max_pages + 1):
+        data = await qloo_core.fetch_qloo_response(get_qloo_tags_list_endpoint(qloo_entity, page, take))
+        page_tags = data.get("results", {}).get("tags", [])
+        if not page_tags:
+            break
+        for tag in page_tags:
+            tag_id = tag.get("id") or tag.get("tag_id")
+            if tag_id and tag_id not in seen_ids:
+                seen_ids.add(tag_id)
+                tags.append({'id': tag_id, 'name': tag.get('name'), 'type': tag.get('type', '')})
+
+    os.makedirs(TAG_INDEX_PATH, exist_ok=True)
+    path = get_index_file_path(entity_name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(tags, f)
+    os.replace(tmp_path, path)
+    _indexes[entity_name] = TagIndex(tags)
+    print(f"Stored {len(tags)} tags for {entity_name} at {path}")
+    return len(tags)
+
+async def _refresh_all(entity_names, take, max_pages):
+    from core import qloo_core
+    try:
+        for entity_name in entity_names:
+            await refresh_tag_index(entity_name, take=take, max_pages=max_pages)
+    finally:
+        await qloo_core.close_qloo_client()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the local Qloo tag indexes")
+    parser.add_argument("--entities", default=",".join(INDEXED_ENTITIES), help="Comma-separated entity names to refresh")
+    parser.add_argument("--take", type=int, default=50, help="Tags to request per page")
+    parser.add_argument("--max-pages", type=int, default=TAG_INDEX_MAX_PAGES, help="Maximum pages to fetch per entity")
+    args = parser.parse_args()
+    asyncio.run(_refresh_all([e.strip() for e in args.entities.split(",") if e.strip()], args.take, args.max_pages))
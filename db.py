@@ -1,34 +1,231 @@
-from pymongo import MongoClient
-from config import DB_URL, RECOMMENDATIONS_PER_PAGE
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from bson import ObjectId
+from config import (
+    DB_URL, RECOMMENDATIONS_PER_PAGE, DB_MAX_POOL_SIZE, DB_MIN_POOL_SIZE, DB_MAX_IDLE_TIME_MS,
+    DB_SERVER_SELECTION_TIMEOUT_MS, RECOMMENDATION_COUNTER_ENABLED
+)
 from utils import clean_text
+from contextvars import ContextVar
+from datetime import datetime
+import asyncio
+import base64
+import functools
+import json
+from dtos.recommendation_model import Recommendation
 
-db_client = MongoClient(DB_URL)
+# Motor binds to the running event loop on first use, so the client can be created at import
+db_client = AsyncIOMotorClient(
+    DB_URL,
+    maxPoolSize=DB_MAX_POOL_SIZE,
+    minPoolSize=DB_MIN_POOL_SIZE,
+    maxIdleTimeMS=DB_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=DB_SERVER_SELECTION_TIMEOUT_MS,
+)
 db_conn = db_client['recommendi_db']
 recommendations_collection = db_conn['recommendations']
 session_collection = db_conn['session_data']
+qloo_cache_collection = db_conn['qloo_response_cache']
+decomposition_cache_collection = db_conn['decomposition_cache']
+enrichment_cache_collection = db_conn['enrichment_cache']
 
-def add_recommendation(recommendation):
+# Session fields read or set during the current core call: (session_id, field path) -> value
+_session_fields_memo = ContextVar("session_fields_memo", default=None)
+
+def close_db_client():
+    """
+    Close the database client and its pooled connections.
+
+    Returns:
+        None
+    """
+    db_client.close()
+
+# Indexes of the hot queries: (collection, keys, options), created by ensure_indexes
+INDEX_SPECS = [
+    # get_recommendations_using_details filters on all four fields and pages on _id
+    (recommendations_collection, [('session_id', 1), ('cleaned_user_message', 1), ('recommendation_category', 1), ('tag_id', 1), ('_id', 1)], {'name': 'session_message_category_tag'}),
+    # Every status read and write goes through the session's single document
+    (session_collection, [('session_id', 1)], {'name': 'session_id_unique', 'unique': True}),
+    # Expired cache entries are already ignored by the reads, TTL indexes let Mongo remove them
+    (qloo_cache_collection, [('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    (decomposition_cache_collection, [('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    (enrichment_cache_collection, [('expires_at', 1)], {'name': 'expires_at_ttl', 'expireAfterSeconds': 0}),
+    # Warming the enrichment cache reads the most recent entries of a prompt version
+    (enrichment_cache_collection, [('prompt_version', 1), ('expires_at', -1)], {'name': 'prompt_version_expires_at'}),
+]
+
+async def ensure_indexes():
+    """
+    Create the indexes of INDEX_SPECS that do not exist yet.
+
+    Creating an index that already exists with the same keys and options does nothing, so
+    this is safe to run on every startup. An index that cannot be created (e.g. the unique
+    session index while duplicate sessions exist) is reported and the others still are.
+
+    Returns:
+        dict: Index name -> True if it exists now, False if creating it failed.
+    """
+    created = {}
+    for collection, keys, options in INDEX_SPECS:
+        name = f"{collection.name}.{options['name']}"
+        try:
+            await collection.create_index(keys, **options)
+            created[name] = True
+        except Exception as e:
+            print(f"Error creating index {name}: {e}")
+            created[name] = False
+    print(f"Database indexes ensured: {created}")
+    return created
+
+def _get_plan_stages(plan):
+    """
+    Get every stage of a query plan, depth first.
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_get_plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(_get_plan_stages(value))
+    return stages
+
+def _get_winning_plan_stages(explanation):
+    """
+    Get the stages of the winning plans of an explain() output, which aggregations nest under their stages.
+    """
+    stages = []
+    if isinstance(explanation, dict):
+        for key, value in explanation.items():
+            if key == 'winningPlan':
+                stages.extend(_get_plan_stages(value))
+            elif key != 'rejectedPlans':
+                stages.extend(_get_winning_plan_stages(value))
+    elif isinstance(explanation, list):
+        for value in explanation:
+            stages.extend(_get_winning_plan_stages(value))
+    return stages
+
+async def explain_hot_queries():
+    """
+    Explain the hot queries and report whether each one uses an index.
+
+    The query values are placeholders, the plan only depends on the shape of the query.
+
+    Returns:
+        dict: Query name -> {'uses_index': bool, 'stages': list of the winning plan's stages}.
+    """
+    recommendations_query = {
+        'session_id': 'explain',
+        'cleaned_user_message': 'explain',
+        'recommendation_category': 'movies',
+        'tag_id': None,
+    }
+    explained = {
+        # get_recommendations_using_details, counting the recommendations when the session does not keep it
+        'recommendations_count': await db_conn.command('explain', {
+            'count': recommendations_collection.name,
+            'query': recommendations_query,
+        }, verbosity='queryPlanner'),
+        # get_recommendations_using_details, reading a page after the cursor
+        'recommendations_page': await recommendations_collection.find(
+            {**recommendations_query, '_id': {'$gt': ObjectId('0' * 24)}}, {'tags_original': 0}
+        ).sort('_id', 1).limit(RECOMMENDATIONS_PER_PAGE).explain(),
+        # get_session_status_field and set_session_status_field
+        'session_lookup': await session_collection.find({'session_id': 'explain'}).limit(1).explain(),
+    }
+
+    report = {}
+    for name, explanation in explained.items():
+        stages = _get_winning_plan_stages(explanation)
+        report[name] = {
+            'uses_index': 'COLLSCAN' not in stages and any(stage in ('IXSCAN', 'IDHACK', 'EXPRESS_IXSCAN', 'COUNT_SCAN') for stage in stages),
+            'stages': stages,
+        }
+    return report
+
+async def add_recommendation(recommendation):
     """
     Add a recommendation to the database.
     
     Args:
-        recommendation (dict): The recommendation data to be added.
+        recommendation (Recommendation): The recommendation to be added.
     
     Returns:
         str: The ID of the inserted recommendation.
     """
-    result = recommendations_collection.insert_one(recommendation)
+    result = await recommendations_collection.insert_one(recommendation.to_bson())
+    recommendation.db_id = result.inserted_id
+    if RECOMMENDATION_COUNTER_ENABLED:
+        # Keep the number of recommendations of the query in the session, so pages do not count them
+        count_path = get_session_field_path(recommendation.recommendation_category, recommendation.user_message, recommendation.tag_id, 'recommendation_count')
+        await session_collection.update_one(
+            {'session_id': recommendation.session_id},
+            {'$inc': {count_path: 1}},
+            upsert=True
+        )
+        memo = _session_fields_memo.get()
+        if memo is not None:
+            memo.pop((recommendation.session_id, count_path), None)
     return str(result.inserted_id)
 
-def get_recommendations_using_details(details, page=None):
+def encode_page_cursor(page, last_id):
+    """
+    Build the opaque cursor pointing after the last recommendation of a page.
+
+    Args:
+        page (int): The page number the cursor follows.
+        last_id (ObjectId): The _id of the last recommendation of the page.
+
+    Returns:
+        str: The URL-safe cursor.
+    """
+    data = json.dumps({'p': page, 'id': str(last_id)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor):
+    """
+    Read a cursor built by encode_page_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        tuple: (page number, last _id) of the page the cursor follows.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(data['p']), ObjectId(data['id'])
+    except Exception as e:
+        raise ValueError(f"Invalid page cursor: {cursor}") from e
+
+async def get_recommendations_using_details(details, page=None, cursor=None, total_recommendations=None):
     """
     Get recommendations by the details to use.
-    
+
+    Recommendations are ordered by _id, so pages are stable while more recommendations are
+    added. A page is read from the cursor of the previous page (keyset pagination), which
+    costs the same however deep it is. A page number without a cursor is still accepted for
+    compatibility, but is skipped to, so clients should follow next_cursor.
+
     Args:
         details (dict): The details to use for filtering recommendations.
-    
+        page (int, optional): The page number, None for every recommendation.
+        cursor (str, optional): The next_cursor of the previous page, takes precedence over page.
+        total_recommendations (int, optional): The known number of recommendations (e.g. the session's
+            recommendation_count), counted together with the page read when not given.
+
     Returns:
-        list: A list of recommendations matching the details.
+        dict or None: The page of recommendations with a next_cursor, None if the page is not full.
+
+    Raises:
+        ValueError: If the cursor is not valid.
     """
     query = {
         'session_id': details.get('session_id'),
@@ -37,41 +234,56 @@ def get_recommendations_using_details(details, page=None):
         'tag_id': details.get('tag_id'),
     }
 
-    cursor = recommendations_collection.find(query)#.sort([("is_read_by_user", 1), ("date", -1), ("_id", -1)])  # Sort by date and then by _id in descending order
+    after_id = None
+    if cursor:
+        previous_page, after_id = decode_page_cursor(cursor)
+        page = previous_page + 1
 
+    # The keyset bound goes into the index scan, so a page costs the same however deep it is
+    page_query = {**query, '_id': {'$gt': after_id}} if after_id is not None else query
+    # tags_original is only on older documents and never returned
+    find_cursor = recommendations_collection.find(page_query, {'tags_original': 0}).sort('_id', 1)
     if page is not None:
-            skip = (page - 1) * RECOMMENDATIONS_PER_PAGE
-            cursor = cursor.skip(skip)
-            cursor = cursor.limit(RECOMMENDATIONS_PER_PAGE)
+        if after_id is None and page > 1:
+            # Compatibility for clients still paging by number
+            find_cursor = find_cursor.skip((page - 1) * RECOMMENDATIONS_PER_PAGE)
+        find_cursor = find_cursor.limit(RECOMMENDATIONS_PER_PAGE)
+
+    if total_recommendations is None and page is not None:
+        # Counted on the index, at the same time as the page is read
+        recommendations, total_recommendations = await asyncio.gather(
+            find_cursor.to_list(length=None),
+            recommendations_collection.count_documents(query),
+        )
+    else:
+        recommendations = await find_cursor.to_list(length=None)
+        if total_recommendations is None:
+            total_recommendations = len(recommendations)
 
-    recommendations = list(cursor)
-    
     # If the recommendations are found but not exactly amount for teh page then reurn None also
     if len(recommendations) < RECOMMENDATIONS_PER_PAGE and page is not None:
         return
 
-    for rec in recommendations:
-        rec['id'] = str(rec['_id'])
-        del rec['_id']
-        if 'date' in rec:
-            rec['date'] = rec['date'].strftime("%Y-%m-%d %H:%M:%S")
-    
     # # Shuffle the recommendations to provide a varied experience
     # random.shuffle(recommendations)
-    
-    total_recommendations = recommendations_collection.count_documents(query)
+
+    has_next_page = page is not None and (RECOMMENDATIONS_PER_PAGE * int(page)) < total_recommendations
+    next_cursor = None
+    if has_next_page:
+        next_cursor = encode_page_cursor(page, recommendations[-1]['_id'])
 
     return {
-        "recommendations": [{k:v for k, v in recommendation.items() if k != 'tags_original'} for recommendation in recommendations],
+        "recommendations": [Recommendation.from_bson(recommendation).to_json() for recommendation in recommendations],
         "count": len(recommendations),
         "page": page,
-        'has_next_page': (page is not None and (RECOMMENDATIONS_PER_PAGE * int(page)) < total_recommendations),
+        'has_next_page': has_next_page,
+        'next_cursor': next_cursor,
         'start_next_set': (page is not None and ((total_recommendations - RECOMMENDATIONS_PER_PAGE * int(page)) < 3)),
         'total_recommendations': total_recommendations,
         "status_code": 200
     }
 
-def get_session_data(session_id):
+async def get_session_data(session_id):
     """
     Get session data by session ID.
     
@@ -81,29 +293,26 @@ def get_session_data(session_id):
     Returns:
         dict: The session data.
     """
-    session_data = session_collection.find_one({'session_id': session_id})
+    session_data = await session_collection.find_one({'session_id': session_id})
     if session_data:
         session_data['id'] = str(session_data['_id'])
         del session_data['_id']
     
     return session_data
 
-def set_session_status_field(session_id, recommendation_category, user_message, selected_tag_id, field_key, field_value):
+def get_session_field_path(recommendation_category, user_message, selected_tag_id, field_key):
     """
-    Set any field under a session's recommendation category.
+    Get the path of a field under a session's recommendation category.
 
     Args:
-        session_id (str): The session ID.
         recommendation_category (str): The category of recommendations.
         user_message (str): The user's message (optional if selected_tag_id is provided).
         selected_tag_id (str): The selected tag ID.
-        field_key (str): The specific field to set (e.g., 'is_processing').
-        field_value (Any): The value to assign to the field.
+        field_key (str): The field (e.g., 'is_processing').
 
     Returns:
-        None
+        str: The dotted path of the field in the session document.
     """
-    query = {'session_id': session_id}
     keys_l = []
     if user_message is not None:
         keys_l.append(clean_text(user_message))
@@ -111,7 +320,49 @@ def set_session_status_field(session_id, recommendation_category, user_message,
         keys_l.append(selected_tag_id)
     
     key = ".".join(keys_l) if keys_l else None
-    field_path = f"{recommendation_category}.{key}.{field_key}"
+    return f"{recommendation_category}.{key}.{field_key}"
+
+def memoize_session_fields(func):
+    """
+    Decorate a coroutine function so the session fields it reads are memoized for the duration of each call.
+
+    Reads through get_session_status_field(s) only query Mongo for fields not yet read or
+    set during the call. Each call starts with an empty memo, so a value written elsewhere
+    (e.g. by the background generation while a client polls) is seen on the next call.
+    Tasks created during the call share its memo, and their writes go through to it.
+
+    Args:
+        func (coroutine function): The function to decorate.
+
+    Returns:
+        coroutine function: The decorated function.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _session_fields_memo.set({})
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _session_fields_memo.reset(token)
+    return wrapper
+
+async def set_session_status_field(session_id, recommendation_category, user_message, selected_tag_id, field_key, field_value):
+    """
+    Set any field under a session's recommendation category.
+
+    Args:
+        session_id (str): The session ID.
+        recommendation_category (str): The category of recommendations.
+        user_message (str): The user's message (optional if selected_tag_id is provided).
+        selected_tag_id (str): The selected tag ID.
+        field_key (str): The specific field to set (e.g., 'is_processing').
+        field_value (Any): The value to assign to the field.
+
+    Returns:
+        None
+    """
+    query = {'session_id': session_id}
+    field_path = get_session_field_path(recommendation_category, user_message, selected_tag_id, field_key)
 
     update = {
         '$set': {
@@ -119,9 +370,61 @@ def set_session_status_field(session_id, recommendation_category, user_message,
         }
     }
 
-    session_collection.update_one(query, update, upsert=True)
+    await session_collection.update_one(query, update, upsert=True)
+    memo = _session_fields_memo.get()
+    if memo is not None:
+        memo[(session_id, field_path)] = field_value
+
+def _get_path_value(doc, field_path):
+    # Traverse the nested path to retrieve the value
+    for part in field_path.split('.'):
+        if isinstance(doc, dict) and part in doc:
+            doc = doc[part]
+        else:
+            return None
+    return doc
+
+async def get_session_status_fields(session_id, recommendation_category, user_message, selected_tag_id, field_keys):
+    """
+    Get the values of many fields under a session's recommendation category with one query.
+
+    Inside a call wrapped with memoize_session_fields, fields already read or set during
+    that call are not read again.
+
+    Args:
+        session_id (str): The session ID.
+        recommendation_category (str): The category of recommendations.
+        user_message (str): The user's message (optional if selected_tag_id is provided).
+        selected_tag_id (str): The selected tag ID.
+        field_keys (list): The fields to retrieve (e.g., ['is_processing', 'error_message']).
+
+    Returns:
+        dict: field_key -> value, None for the fields not found.
+    """
+    field_paths = {
+        field_key: get_session_field_path(recommendation_category, user_message, selected_tag_id, field_key)
+        for field_key in field_keys
+    }
+    memo = _session_fields_memo.get()
+    values = {}
+    missing = {}
+    for field_key, field_path in field_paths.items():
+        if memo is not None and (session_id, field_path) in memo:
+            values[field_key] = memo[(session_id, field_path)]
+        else:
+            missing[field_key] = field_path
+
+    if missing:
+        projection = {field_path: 1 for field_path in missing.values()}
+        projection['_id'] = 0
+        doc = await session_collection.find_one({'session_id': session_id}, projection)
+        for field_key, field_path in missing.items():
+            values[field_key] = _get_path_value(doc, field_path) if doc else None
+            if memo is not None:
+                memo[(session_id, field_path)] = values[field_key]
+    return values
 
-def get_session_status_field(session_id, recommendation_category, user_message, selected_tag_id, field_key):
+async def get_session_status_field(session_id, recommendation_category, user_message, selected_tag_id, field_key):
     """
     Get the value of any field under a session's recommendation category.
 
@@ -135,27 +438,134 @@ def get_session_status_field(session_id, recommendation_category, user_message,
     Returns:
         Any or None: The field value if found, otherwise None.
     """
-    query = {'session_id': session_id}
-    keys_l = []
-    if user_message is not None:
-        keys_l.append(clean_text(user_message))
-    if selected_tag_id is not None:
-        keys_l.append(selected_tag_id)
-    
-    key = ".".join(keys_l) if keys_l else None
-    field_path = f"{recommendation_category}.{key}.{field_key}"
+    values = await get_session_status_fields(session_id, recommendation_category, user_message, selected_tag_id, [field_key])
+    return values[field_key]
 
-    projection = {field_path: 1, '_id': 0}
-    doc = session_collection.find_one(query, projection)
+async def get_cached_qloo_response(cache_key):
+    """
+    Get a cached Qloo response that has not expired yet.
 
+    Args:
+        cache_key (str): The canonical cache key of the Qloo endpoint.
+
+    Returns:
+        tuple or None: (serialized response, expiry datetime) if found, otherwise None.
+    """
+    doc = await qloo_cache_collection.find_one({'_id': cache_key, 'expires_at': {'$gt': datetime.utcnow()}})
     if not doc:
         return None
+    return doc['data'], doc['expires_at']
 
-    # Traverse the nested path to retrieve the value
-    parts = field_path.split('.')
-    for part in parts:
-        if isinstance(doc, dict) and part in doc:
-            doc = doc[part]
-        else:
-            return None
-    return doc
\ No newline at end of file
+async def set_cached_qloo_response(cache_key, family, data, expires_at):
+    """
+    Store a Qloo response in the shared cache collection.
+
+    Args:
+        cache_key (str): The canonical cache key of the Qloo endpoint.
+        family (str): The endpoint family (tags, search or insights).
+        data (str): The serialized response.
+        expires_at (datetime): When the cached response stops being valid.
+
+    Returns:
+        None
+    """
+    await qloo_cache_collection.update_one(
+        {'_id': cache_key},
+        {'$set': {'family': family, 'data': data, 'expires_at': expires_at}},
+        upsert=True
+    )
+
+async def get_cached_decomposition(cache_key):
+    """
+    Get a cached message decomposition that has not expired yet.
+
+    Args:
+        cache_key (str): The cache key of the decomposition.
+
+    Returns:
+        tuple or None: (serialized decomposition, expiry datetime) if found, otherwise None.
+    """
+    doc = await decomposition_cache_collection.find_one({'_id': cache_key, 'expires_at': {'$gt': datetime.utcnow()}})
+    if not doc:
+        return None
+    return doc['data'], doc['expires_at']
+
+async def set_cached_decomposition(cache_key, data, expires_at):
+    """
+    Store a message decomposition in the shared cache collection.
+
+    Args:
+        cache_key (str): The cache key of the decomposition.
+        data (str): The serialized decomposition.
+        expires_at (datetime): When the cached decomposition stops being valid.
+
+    Returns:
+        None
+    """
+    await decomposition_cache_collection.update_one(
+        {'_id': cache_key},
+        {'$set': {'data': data, 'expires_at': expires_at}},
+        upsert=True
+    )
+
+async def get_cached_enrichments(cache_keys):
+    """
+    Get the cached context and score of many recommendations that have not expired yet.
+
+    Args:
+        cache_keys (list): The cache keys.
+
+    Returns:
+        dict: cache_key -> ({'context', 'score'}, expiry datetime) for the keys found.
+    """
+    docs = enrichment_cache_collection.find(
+        {'_id': {'$in': list(cache_keys)}, 'expires_at': {'$gt': datetime.utcnow()}},
+        {'context': 1, 'score': 1, 'expires_at': 1}
+    )
+    return {
+        doc['_id']: ({'context': doc.get('context'), 'score': doc.get('score')}, doc['expires_at'])
+        async for doc in docs
+    }
+
+async def get_recent_cached_enrichments(prompt_version, limit):
+    """
+    Get the most recently cached contexts and scores of a prompt version.
+
+    Args:
+        prompt_version (str): The version of the scoring prompts.
+        limit (int): The maximum number of entries.
+
+    Returns:
+        dict: cache_key -> ({'context', 'score'}, expiry datetime), most recent first.
+    """
+    docs = enrichment_cache_collection.find(
+        {'prompt_version': prompt_version, 'expires_at': {'$gt': datetime.utcnow()}},
+        {'context': 1, 'score': 1, 'expires_at': 1}
+    ).sort('expires_at', -1).limit(limit)
+    return {
+        doc['_id']: ({'context': doc.get('context'), 'score': doc.get('score')}, doc['expires_at'])
+        async for doc in docs
+    }
+
+async def set_cached_enrichments(entries, prompt_version, expires_at):
+    """
+    Store the context and score of many recommendations in the shared cache collection.
+
+    Args:
+        entries (dict): cache_key -> {'context', 'score'}.
+        prompt_version (str): The version of the scoring prompts.
+        expires_at (datetime): When the cached entries stop being valid.
+
+    Returns:
+        None
+    """
+    if not entries:
+        return
+    await enrichment_cache_collection.bulk_write([
+        UpdateOne(
+            {'_id': cache_key},
+            {'$set': {**data, 'prompt_version': prompt_version, 'expires_at': expires_at}},
+            upsert=True
+        )
+        for cache_key, data in entries.items()
+    ], ordered=False)
@@ -0,0 +1,119 @@
+class Tag:
+    """
+    A tag attached to a recommendation.
+    """
+    __slots__ = ('name', 'id')
+
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+
+    def to_dict(self):
+        return {'name': self.name, 'id': self.id}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('name'), data.get('id'))
+
+
+class Recommendation:
+    """
+    A single recommendation as it moves from the Qloo transformers through enrichment into the database and the API.
+
+    Uses __slots__ so large pages and enrichment batches do not carry a dict per recommendation.
+    """
+    # Fields describing the recommended item itself
+    ITEM_FIELDS = ('title', 'id', 'description', 'image', 'extra_data')
+    # Fields only some entity types have, kept (even when None) by the recommendations built with them
+    OPTIONAL_FIELDS = ('genre', 'release_date', 'author', 'publication_date', 'address')
+    # Fields added by enrichment and when saving for a session
+    SAVED_FIELDS = (
+        'context', 'score', 'extra_data_string', 'session_id', 'user_message',
+        'cleaned_user_message', 'recommendation_category', 'tag_id',
+    )
+    # Saved fields left out of API responses
+    INTERNAL_FIELDS = ('score',)
+
+    __slots__ = ITEM_FIELDS + OPTIONAL_FIELDS + SAVED_FIELDS + ('tags', 'db_id', 'item_fields')
+
+    def __init__(self, **fields):
+        # The item fields in the order they were given, so documents and API responses keep
+        # the shape each entity transformer builds
+        item_fields = [field for field in fields if field in self.ITEM_FIELDS + self.OPTIONAL_FIELDS + ('tags',)]
+        item_fields += [field for field in self.ITEM_FIELDS + ('tags',) if field not in item_fields]
+        self.item_fields = tuple(item_fields)
+        for field in self.ITEM_FIELDS + self.OPTIONAL_FIELDS + self.SAVED_FIELDS:
+            setattr(self, field, fields.pop(field, None))
+        self.extra_data = self.extra_data or {}
+        self.tags = fields.pop('tags', None) or []
+        if fields:
+            raise TypeError(f"Unknown recommendation fields: {', '.join(fields)}")
+        self.db_id = None
+
+    def to_prompt_dict(self):
+        """
+        Get the fields describing the recommended item, as given to the LLM.
+
+        Returns:
+            dict: The item fields.
+        """
+        data = {field: getattr(self, field) for field in self.ITEM_FIELDS}
+        for field in self.OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        data['tags'] = [tag.to_dict() for tag in self.tags]
+        return data
+
+    def to_bson(self):
+        """
+        Encode the recommendation as a document for the recommendations collection.
+
+        Returns:
+            dict: The document.
+        """
+        document = {
+            field: [tag.to_dict() for tag in self.tags] if field == 'tags' else getattr(self, field)
+            for field in self.item_fields
+        }
+        for field in self.SAVED_FIELDS:
+            document[field] = getattr(self, field)
+        if self.db_id is not None:
+            document['_id'] = self.db_id
+        return document
+
+    @classmethod
+    def from_bson(cls, document):
+        """
+        Decode a document from the recommendations collection. Unknown keys (e.g. the
+        'tags_original' of older documents) are ignored.
+
+        Args:
+            document (dict): The document.
+
+        Returns:
+            Recommendation: The decoded recommendation.
+        """
+        known_fields = cls.ITEM_FIELDS + cls.OPTIONAL_FIELDS + cls.SAVED_FIELDS
+        recommendation = cls(**{
+            key: [Tag.from_dict(tag) for tag in value or []] if key == 'tags' else value
+            for key, value in document.items()
+            if key in known_fields or key == 'tags'
+        })
+        recommendation.db_id = document.get('_id')
+        return recommendation
+
+    def to_json(self):
+        """
+        Encode the recommendation for an API response. Saved recommendations are identified by their database ID.
+
+        Returns:
+            dict: JSON-serializable representation.
+        """
+        data = self.to_bson()
+        data.pop('_id', None)
+        for field in self.INTERNAL_FIELDS:
+            data.pop(field, None)
+        if self.db_id is not None:
+            data['id'] = str(self.db_id)
+        return data
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from config import appENV, PORT
+from config import appENV, PORT, DB_ENSURE_INDEXES_ON_STARTUP
 from routes import base_routes
+import db
+from core import enrichment_cache, llm_core, qloo_core, query_index, tag_index
 
 ## Define API prefix based on environment
 prefix = "/" + ("recommendi" if appENV == "production"  else ("recommendi" if appENV == "development" else "dev"))
@@ -38,6 +40,32 @@ app.add_middleware(
 # Include routers
 app.include_router(base_routes.router, prefix=prefix)
 
+@app.on_event("startup")
+async def startup_event():
+    # Create the indexes of the hot queries if they are missing
+    if DB_ENSURE_INDEXES_ON_STARTUP:
+        await db.ensure_indexes()
+    # Load the tokenizer used for prompt budgets, it may have to be downloaded
+    await llm_core.load_token_encoding()
+    # Load the local tag indexes used to resolve generic terms
+    tag_index.load_tag_indexes()
+    # Load the near-duplicate message indexes saved by the last run
+    query_index.load_query_indexes()
+    # Optionally load recently cached recommendation scores from Mongo
+    await enrichment_cache.warm_enrichment_cache()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Release pooled Qloo connections
+    await qloo_core.close_qloo_client()
+    qloo_core.shutdown_transform_pool()
+    # Release pooled OpenAI connections
+    await llm_core.close_llm_client()
+    # Keep the near-duplicate message indexes for the next run
+    query_index.save_query_indexes()
+    # Release pooled Mongo connections
+    db.close_db_client()
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,7 +1,6 @@
 from fastapi import APIRouter
 from dtos.recommendation_fetch_dto import RecommendationFetchDTO
-from routesLogic import recommendationRoutesLogic
-import asyncio
+from routesLogic import recommendationRoutesLogic, metricsRoutesLogic
 
 ENTITIES_FORMATTED = {
     "Movies": "movies",
@@ -83,11 +82,13 @@ async def generate_recommendations(recommendation_fetch_dto: RecommendationFetch
     return recommendations
 
 @router.get("/recommendations/{session_id}/details", tags=["Recommendi APIs"])
-async def get_recommendations_by_details(session_id: str, recommendation_category: str, user_message: str = None, selected_tag_id: str = None, page: int = 1):
+async def get_recommendations_by_details(session_id: str, recommendation_category: str, user_message: str = None, selected_tag_id: str = None, page: int = 1, cursor: str = None):
     """
     Fetch recommendations based on the provided details.
     Args:
         details (dict): A dictionary containing the details to filter recommendations.
+        page (int): The page number, used when there is no cursor.
+        cursor (str): The next_cursor returned with the previous page.
     Returns:
         dict: A dictionary containing the recommendations and metadata.
     """
@@ -103,6 +104,13 @@ async def get_recommendations_by_details(session_id: str, recommendation_categor
         'recommendation_category': ENTITIES_FORMATTED[recommendation_category],
         'user_message': user_message,
         'tag_id': selected_tag_id
-    }, page=page)
+    }, page=page, cursor=cursor)
 
-    return recommendations
\ No newline at end of file
+    return recommendations
+
+@router.get("/metrics", tags=["Recommendi APIs"])
+async def get_metrics():
+    """
+    Get internal metrics such as cache hit/miss counters.
+    """
+    return await metricsRoutesLogic.get_metrics()
@@ -0,0 +1,25 @@
+from core import qloo_cache, prefetch, qloo_core, llm_core, llm_telemetry, decomposition_cache, query_index, enrichment_cache, pre_ranker
+
+async def get_metrics():
+    """
+    Collect the internal metrics exposed by the core modules.
+
+    Returns:
+        dict: A dictionary containing the metrics grouped by component.
+    """
+    return {
+        "qloo_cache": qloo_cache.get_cache_stats(),
+        "decomposition_cache": decomposition_cache.get_cache_stats(),
+        "query_index": query_index.get_query_index_stats(),
+        "enrichment_cache": enrichment_cache.get_cache_stats(),
+        "pre_ranker": pre_ranker.get_pre_ranker_stats(),
+        "prefetch": prefetch.get_prefetch_stats(),
+        "qloo_limiter": qloo_core.get_qloo_limiter_stats(),
+        "qloo_single_flight": qloo_core.qloo_single_flight.get_stats(),
+        "llm_single_flight": llm_core.llm_single_flight.get_stats(),
+        "llm_concurrency": llm_core.get_llm_concurrency_stats(),
+        "llm_streaming": llm_core.get_streaming_stats(),
+        "llm_prompt_serialization": llm_core.get_prompt_serialization_stats(),
+        "llm_telemetry": llm_telemetry.get_llm_telemetry(),
+        "status_code": 200
+    }
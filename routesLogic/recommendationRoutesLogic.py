@@ -34,12 +34,15 @@ async def generate_recommendations(recommendation_fetch_data: RecommendationFetc
     recommendations = await get_recommendations_by_details(details=details, page=1, wait = False)
     return recommendations
 
-async def get_recommendations_by_details(details: dict, page=1 , wait=True):
+async def get_recommendations_by_details(details: dict, page=1 , wait=True, cursor=None):
     """
     Fetch recommendations based on the provided details.
     
     Args:
         details (dict): A dictionary containing the details to filter recommendations.
+        page (int): The page number, used when there is no cursor.
+        wait (bool): Whether to keep polling while the recommendations are being generated.
+        cursor (str, optional): The next_cursor of the previous page.
     
     Returns:
         list: A list of recommendations based on the provided details.
@@ -47,7 +50,10 @@ async def get_recommendations_by_details(details: dict, page=1 , wait=True):
     recommendations, is_processing, error_message = None, True, None
     trials = 0
     while not recommendations:
-        recommendations, is_processing, error_message = await recommednations.get_recommendations_by_details(details, page=page)
+        try:
+            recommendations, is_processing, error_message = await recommednations.get_recommendations_by_details(details, page=page, cursor=cursor)
+        except ValueError as e:
+            return {"message": str(e), "status_code": 400}
         if wait: # If wait is True, we will keep checking for recommendations until we get some or reach a limit
             if trials >= 3:
                 # Confirm is processing status is True to keep waiting else break
@@ -0,0 +1,124 @@
+import json
+import random
+import re
+
+import pytest
+
+from utils import JSONScanner, clean_and_parse_json, extract_dictionary_from_string, extract_list_from_string
+
+
+def legacy_clean_and_parse_json(input_string):
+    # The parse used before the scanner: drop newlines and tabs, drop trailing commas, json.loads
+    cleaned_string = re.sub(r'[\n\t]', '', input_string).strip()
+    cleaned_string = re.sub(r',(\s*[\}\]])', r'\1', cleaned_string)
+    try:
+        return json.loads(cleaned_string)
+    except json.JSONDecodeError:
+        return None
+
+
+ITEMS = [{"index": 0, "context": "A tense {thriller}", "score": 8}, {"index": 1, "context": "Not [really] a fit", "score": 3}]
+ITEMS_JSON = json.dumps(ITEMS)
+
+TRAILING_COMMAS_JSON = '[{"index": 0, "context": "A tense {thriller}", "score": 8,}, {"index": 1, "context": "Not [really] a fit", "score": 3},]'
+NESTED_JSON = '[{"index": 0, "tags": [["a", "b"], []], "meta": {"x": [1, {"y": "]"}]}}]'
+ESCAPED_JSON = '[{"context": "He said \\"[no]\\" twice", "score": 5}]'
+
+# name -> (LLM output, the JSON in it)
+LIST_CASES = {
+    "bare": (ITEMS_JSON, ITEMS_JSON),
+    "prose": (f"Here are the scores: {ITEMS_JSON} Hope this helps!", ITEMS_JSON),
+    "fenced": (f"```json\n{ITEMS_JSON}\n```", ITEMS_JSON),
+    "indented": (json.dumps(ITEMS, indent=4), json.dumps(ITEMS, indent=4)),
+    "trailing_commas": (TRAILING_COMMAS_JSON, TRAILING_COMMAS_JSON),
+    "nested": (NESTED_JSON, NESTED_JSON),
+    "escaped_quotes": (ESCAPED_JSON, ESCAPED_JSON),
+    "bracket_in_prose": (f"Scores [see below]:\n{ITEMS_JSON}", ITEMS_JSON),
+}
+
+
+@pytest.mark.parametrize("name", sorted(LIST_CASES))
+def test_extract_list_matches_legacy_parse(name):
+    text, json_text = LIST_CASES[name]
+    expected = legacy_clean_and_parse_json(json_text)
+    assert expected is not None
+    assert extract_list_from_string(text) == expected
+
+
+def test_extract_list_wrapped_in_object():
+    text = f'{{"results": {ITEMS_JSON}}}'
+    assert extract_list_from_string(text) == legacy_clean_and_parse_json(text)["results"]
+
+
+def test_extract_list_ignores_brackets_in_strings_of_wrapping_object():
+    text = '{"note": "see [1]", "results": [{"a": 1}]}'
+    assert extract_list_from_string(text) == [{"a": 1}]
+
+
+def test_extract_list_without_json():
+    assert extract_list_from_string("Sorry, I cannot help with that.") is None
+    assert extract_list_from_string(None) is None
+
+
+def test_extract_dictionary_matches_legacy_parse():
+    text = '```json\n{"context": "Fits the {mood}, see [1]", "score": 7,}\n```'
+    assert extract_dictionary_from_string(text) == legacy_clean_and_parse_json(text[text.index('{'):text.rindex('}') + 1])
+
+
+def test_extract_dictionary_after_unmatched_bracket():
+    text = 'Note [ unfinished, then {"context": "ok", "score": 6}'
+    assert extract_dictionary_from_string(text) == {"context": "ok", "score": 6}
+
+
+def test_raw_newlines_in_strings_are_kept():
+    # The legacy parse removed them, the new one keeps the text as written
+    text = '{"context": "line one\nline two", "score": 7}'
+    assert extract_dictionary_from_string(text) == {"context": "line one\nline two", "score": 7}
+    assert clean_and_parse_json(text) == {"context": "line one\nline two", "score": 7}
+
+
+def feed_in_chunks(scanner, text, rng):
+    # Split at random boundaries, including inside strings and escapes
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 7)
+        scanner.feed(text[position:position + size])
+        position += size
+    if scanner.first() is None:
+        scanner.finish()
+    return scanner.first()
+
+
+@pytest.mark.parametrize("name", sorted(LIST_CASES))
+def test_feed_chunk_split_matches_whole_text(name):
+    rng = random.Random(name)
+    text, _ = LIST_CASES[name]
+    for _ in range(50):
+        assert feed_in_chunks(JSONScanner('['), text, rng) == extract_list_from_string(text)
+
+
+def random_value(rng, depth=0):
+    kind = rng.choice(["str", "int", "list", "dict"] if depth < 3 else ["str", "int"])
+    if kind == "str":
+        return "".join(rng.choice('ab {}[]",:\\') for _ in range(rng.randint(0, 8)))
+    if kind == "int":
+        return rng.randint(-100, 100)
+    if kind == "list":
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(0, 3))}
+
+
+def test_fuzz_random_documents():
+    rng = random.Random(20)
+    for _ in range(1000):
+        items = [{"index": i, "value": random_value(rng)} for i in range(rng.randint(1, 4))]
+        document = json.dumps(items, indent=rng.choice([None, 2]))
+        text = rng.choice(["{}", "Result: {}", "```json\n{}\n```", '{{"results": {}}}']).format(document)
+        assert extract_list_from_string(text) == items
+        legacy = legacy_clean_and_parse_json(document)
+        if legacy != items:
+            # The legacy parse also dropped commas and newlines inside strings, e.g. "a,]"
+            assert re.search(r',\s*[\]}]|[\n\t]', json.dumps(items))
+        else:
+            assert extract_list_from_string(text) == legacy
+        assert feed_in_chunks(JSONScanner('['), text, rng) == items
@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+from types import SimpleNamespace
+
+from core import llm_core, llm_telemetry
+
+
+def test_shared_llm_call_is_recorded_for_every_waiter(monkeypatch):
+    released = asyncio.Event()
+    upstream_calls = []
+
+    async def fake_get_llm_response(sys_prompt, user_prompt=None, prompt_type=None):
+        upstream_calls.append(sys_prompt)
+        await released.wait()
+        llm_telemetry.record_llm_call(prompt_type, "test-model", 0.5, prompt_tokens=100, completion_tokens=20)
+        return "response"
+
+    monkeypatch.setattr(llm_core, "get_llm_response", fake_get_llm_response)
+
+    async def request(label):
+        summary = llm_telemetry.start_request_summary(label)
+        response = await llm_core.get_shared_llm_response("system", "user", prompt_type=llm_telemetry.DECOMPOSITION)
+        return response, summary
+
+    async def main():
+        # Each request runs in its own context, as the requests of the app do
+        first = asyncio.create_task(request("first"), context=contextvars.Context())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(request("second"), context=contextvars.Context())
+        await asyncio.sleep(0)
+        released.set()
+        return await first, await second
+
+    (first_response, first_summary), (second_response, second_summary) = asyncio.run(main())
+
+    assert upstream_calls == ["system"]
+    assert first_response == second_response == "response"
+    for summary, shared_calls in ((first_summary, 0), (second_summary, 1)):
+        assert summary["calls"] == 1
+        assert summary["shared_calls"] == shared_calls
+        assert summary["prompt_tokens"] == 100
+        assert summary["completion_tokens"] == 20
+        assert summary["by_prompt_type"][llm_telemetry.DECOMPOSITION]["tokens"] == 120
+
+
+class FakeStream:
+    def __init__(self, deltas, released):
+        self.deltas = deltas
+        self.released = released
+
+    async def __aiter__(self):
+        await self.released.wait()
+        for delta in self.deltas:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=80, completion_tokens=30), choices=[])
+
+    async def close(self):
+        pass
+
+
+def test_shared_streamed_call_is_recorded_for_every_waiter(monkeypatch):
+    released = asyncio.Event()
+    upstream_calls = []
+
+    async def create(**kwargs):
+        upstream_calls.append(kwargs["messages"])
+        stream = FakeStream(['{"score": 8, ', '"context": "A close match."}'], released)
+        return SimpleNamespace(retries_taken=0, parse=lambda: stream)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=SimpleNamespace(create=create))))
+    monkeypatch.setattr(llm_core, "get_llm_client", lambda: client)
+    monkeypatch.setattr(llm_core, "count_tokens", lambda text: len(text.split()))
+
+    async def request(label):
+        summary = llm_telemetry.start_request_summary(label)
+        context_and_score = await llm_core.get_context_and_score_for_recommendation_streamed(
+            {"title": "Dune", "description": "Sand"}, user_message="space epics", recommendation_category="Movies"
+        )
+        return context_and_score, summary
+
+    async def main():
+        first = asyncio.create_task(request("first"), context=contextvars.Context())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(request("second"), context=contextvars.Context())
+        await asyncio.sleep(0)
+        released.set()
+        return await first, await second
+
+    (first_result, first_summary), (second_result, second_summary) = asyncio.run(main())
+
+    assert len(upstream_calls) == 1
+    assert first_result == second_result == {"score": 8, "context": "A close match."}
+    for summary, shared_calls in ((first_summary, 0), (second_summary, 1)):
+        assert summary["calls"] == 1
+        assert summary["shared_calls"] == shared_calls
+        assert summary["by_prompt_type"][llm_telemetry.CONTEXT_STREAM]["tokens"] == 110
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from bson import ObjectId
+
+from dtos.recommendation_model import Recommendation, Tag
+
+TAGS = [{'name': 'Thriller', 'id': 'urn:tag:genre:media:thriller'}]
+
+# The dicts the entity transformers built before the model, in their key order
+ITEMS = {
+    "movie": {
+        'title': 'Heat', 'id': 'E1', 'release_date': None, 'description': 'A heist.', 'genre': None,
+        'image': {'url': 'heat.png'}, 'extra_data': {'rating': 8}, 'tags': TAGS,
+    },
+    "place": {
+        'title': 'Cafe', 'id': 'E2', 'description': 'Coffee.', 'address': '1 Main St',
+        'image': None, 'tags': TAGS, 'extra_data': {'price_level': 2},
+    },
+    "book": {
+        'title': 'Dune', 'id': 'E3', 'author': None, 'publication_date': '1965',
+        'image': None, 'description': 'Sand.', 'extra_data': {}, 'tags': TAGS,
+    },
+}
+
+SESSION_FIELDS = {
+    'session_id': 's1',
+    'user_message': 'Something Tense',
+    'cleaned_user_message': 'something tense',
+    'recommendation_category': 'Movies',
+    'tag_id': None,
+}
+
+
+def legacy_to_json(item, db_id):
+    # The save and read path before the model: the saved dict, the document Mongo returns
+    # (_id first) and the API conversion of that document
+    saved = {**item, 'tags_original': TAGS, 'context': 'Fits.', 'extra_data_string': 'rating 8', **SESSION_FIELDS}
+    document = {'_id': db_id, **saved}
+    document['id'] = str(document['_id'])
+    del document['_id']
+    return {key: value for key, value in document.items() if key != 'tags_original'}
+
+
+def model_to_json(item, db_id):
+    recommendation = Recommendation(**{**item, 'tags': [Tag.from_dict(tag) for tag in item['tags']]})
+    recommendation.context = 'Fits.'
+    recommendation.score = 8
+    recommendation.extra_data_string = 'rating 8'
+    for field, value in SESSION_FIELDS.items():
+        setattr(recommendation, field, value)
+    recommendation.db_id = db_id
+    document = {'_id': db_id, **recommendation.to_bson()}
+    return Recommendation.from_bson(document).to_json()
+
+
+@pytest.mark.parametrize("name", sorted(ITEMS))
+def test_to_json_matches_legacy_shape(name):
+    db_id = ObjectId()
+    assert json.dumps(model_to_json(ITEMS[name], db_id)) == json.dumps(legacy_to_json(ITEMS[name], db_id))
+
+
+def test_legacy_document_round_trip():
+    db_id = ObjectId()
+    document = {'_id': db_id, **ITEMS["movie"], 'context': 'Fits.', 'extra_data_string': 'rating 8', **SESSION_FIELDS}
+    assert json.dumps(Recommendation.from_bson(document).to_json()) == json.dumps(legacy_to_json(ITEMS["movie"], db_id))
+
+
+def test_prompt_dict_omits_unset_optional_fields():
+    recommendation = Recommendation(**{**ITEMS["movie"], 'tags': []})
+    prompt_dict = recommendation.to_prompt_dict()
+    assert 'genre' not in prompt_dict and 'release_date' not in prompt_dict
+    assert 'score' not in prompt_dict and 'session_id' not in prompt_dict
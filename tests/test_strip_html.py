@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from utils import strip_html
+
+
+def legacy_clean_html_text(html_text):
+    # The BeautifulSoup path strip_html replaced, bs4 is pinned in requirements-dev.txt
+    import bs4
+
+    soup = bs4.BeautifulSoup(html_text, "html.parser")
+    for tag in soup.find_all(['i', 'em', 'script', 'style']):
+        tag.decompose()
+    return soup.get_text(separator=' ', strip=True)
+
+
+# The outputs BeautifulSoup gave for each case, frozen so the parity holds without bs4 installed
+CASES = {
+    "plain": ("A heist thriller set in Lagos.", "A heist thriller set in Lagos."),
+    "plain_whitespace": ("   padded text \n\t ", "padded text"),
+    "entities": (
+        "Tom &amp; Jerry &lt;3 caf&eacute; &#169; &#x2014; &quot;quoted&quot;",
+        'Tom & Jerry <3 caf\u00e9 \u00a9 \u2014 "quoted"',
+    ),
+    "nested": ("<div><p>First <b>bold <span>deep</span></b> text</p><p>Second</p></div>", "First bold deep text Second"),
+    "br": ("Line one<br>Line two<br/>Line three<br />end", "Line one Line two Line three end"),
+    "skip_tags": ("Keep <i>drop italic</i> this <em>drop <b>nested</b></em> too", "Keep this too"),
+    "script_style": ("<style>p { color: red; }</style>Visible<script>var x = '<b>';</script> text", "Visible text"),
+    "whitespace": ("<p>\n   spaced    out   \n</p>\n\n<p>\tnext\t</p>", "spaced    out next"),
+    "unclosed": ("<p>Open paragraph <b>bold never closed", "Open paragraph bold never closed"),
+    "stray_end": ("Text</b> after stray</p> end", "Text after stray end"),
+    "unclosed_skip": ("Before <i>italic never closed <b>still inside", "Before"),
+    "end_closes_inner": ("<div><i>dropped <b>also</div> kept", "kept"),
+    "comment": ("Before<!-- hidden comment -->After", "Before After"),
+    "doctype": ("<!DOCTYPE html><html><body>Body text</body></html>", "Body text"),
+    "attributes": ('<a href="/x?a=1&amp;b=2" title="t">Link text</a>', "Link text"),
+    "empty_tags": ("<p></p><div>  </div><span>only</span>", "only"),
+    "void_tags": ('Image <img src="x.png"> and <hr> rule', "Image and rule"),
+    "uppercase": ("<P>Upper <B>case</B></P>", "Upper case"),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_strip_html_matches_beautifulsoup(name):
+    html_text, expected = CASES[name]
+    assert strip_html(html_text) == expected
+
+
+def test_empty_input():
+    assert strip_html("") == ""
+    assert strip_html(None) == ""
+
+
+def test_fuzz_random_markup():
+    rng = random.Random(7)
+    pieces = [
+        "<p>", "</p>", "<b>", "</b>", "<i>", "</i>", "<em>", "</em>", "<div>", "</div>",
+        "<br>", "<br/>", "<span class=\"x\">", "</span>", "<script>", "</script>",
+        " ", "\n", "\t", "word", "two words", "&amp;", "&lt;", "&#169;", "&eacute;", "<!-- c -->",
+    ]
+    for _ in range(2000):
+        html_text = "".join(rng.choice(pieces) for _ in range(rng.randint(1, 20)))
+        assert strip_html(html_text) == legacy_clean_html_text(html_text), html_text
@@ -0,0 +1,45 @@
+import asyncio
+
+from core import qloo_core, tag_index
+
+TAGS = [
+    {'id': 'urn:tag:genre:media:thriller', 'name': 'Thriller', 'type': 'urn:tag:genre:media'},
+    {'id': 'urn:tag:genre:media:comedy', 'name': 'Comedy', 'type': 'urn:tag:genre:media'},
+    {'id': 'urn:tag:keyword:qloo:heist', 'name': 'Heist', 'type': 'urn:tag:keyword:qloo'},
+]
+
+
+def resolve(monkeypatch, query, api_tags):
+    requested = []
+
+    async def make_qloo_request(endpoint):
+        requested.append(endpoint)
+        return {"results": {"tags": api_tags}}
+
+    monkeypatch.setattr(qloo_core, "make_qloo_request", make_qloo_request)
+    monkeypatch.setitem(tag_index._indexes, "movies", tag_index.TagIndex(TAGS))
+    return asyncio.run(qloo_core.get_qloo_tag_to_use_for_non_specific("movies", query)), requested
+
+
+def test_exact_index_match_skips_qloo(monkeypatch):
+    tag_id, requested = resolve(monkeypatch, "thriller", [])
+    assert tag_id == 'urn:tag:genre:media:thriller'
+    assert requested == []
+
+
+def test_keyword_index_match_skips_qloo(monkeypatch):
+    tag_id, requested = resolve(monkeypatch, "heist", [])
+    assert tag_id == 'urn:tag:keyword:media:heist'
+    assert requested == []
+
+
+def test_typo_index_match_falls_through_to_qloo(monkeypatch):
+    api_tags = [{'id': 'urn:tag:genre:media:thrill_ride', 'name': 'Thrill Ride', 'type': 'urn:tag:genre:media'}]
+    tag_id, requested = resolve(monkeypatch, "thrillr", api_tags)
+    assert len(requested) == 1
+    assert tag_id == 'urn:tag:genre:media:thrill_ride'
+
+
+def test_first_genre_fallback_only_for_qloo_results():
+    assert qloo_core.select_tag_to_use(TAGS[1:2], "thrillr") == 'urn:tag:genre:media:comedy'
+    assert qloo_core.select_tag_to_use(TAGS[1:2], "thrillr", match_required=True) is None
@@ -5,6 +5,8 @@ from config import GOOGLE_API_KEY, COUNTRY_NAMES, SHAPEFILE_PATH
 import json
 import re
 import unicodedata
+from html.parser import HTMLParser
+from collections import deque
 from countryinfo import CountryInfo
 from geopy.distance import geodesic
 import geopandas as gpd
@@ -202,44 +204,223 @@ def get_all_location_details(address, country_level=False):
     }
 
 
+class JSONScanner:
+    """
+    Incremental scanner finding complete top-level JSON objects and/or arrays in text.
+
+    Text is fed in chunks (e.g. as it streams from the LLM) and scanned once: brackets are
+    counted outside of strings only, so nested values and braces inside strings do not end
+    a value early. Anything around the values, such as prose or markdown code fences, is
+    skipped. Objects and arrays are both tracked whatever kinds are looked for, so a bracket
+    inside a string of a value is never taken as the start of another one. A value of
+    another kind is searched for the first nested value of a wanted kind, e.g. the list in
+    {"results": [...]}. A value that does not parse is rescanned from after its opening
+    bracket, so a stray bracket in the prose does not hide the JSON after it.
+    """
+
+    def __init__(self, kinds='{['):
+        self.types = tuple(t for kind, t in (('{', dict), ('[', list)) if kind in kinds)
+        self.values = []
+        self._reset_value()
+
+    def _reset_value(self):
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def _find_wanted(self, value):
+        """
+        Get the value itself if it is of a wanted kind, otherwise its first nested value that is.
+        """
+        if isinstance(value, self.types):
+            return value
+        children = value.values() if isinstance(value, dict) else value if isinstance(value, list) else ()
+        for child in children:
+            found = self._find_wanted(child)
+            if found is not None:
+                return found
+        return None
+
+    def _scan(self, text):
+        completed = []
+        pending = deque(text)
+        while pending:
+            char = pending.popleft()
+            if self.depth == 0:
+                if char in '{[':
+                    self.buffer = [char]
+                    self.depth = 1
+                continue
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    buffer = self.buffer
+                    value = parse_json_value(''.join(buffer))
+                    self._reset_value()
+                    if value is None:
+                        # Not JSON after all (e.g. "[see below]"), look for values inside it
+                        pending.extendleft(reversed(buffer[1:]))
+                        continue
+                    value = self._find_wanted(value)
+                    if value is not None:
+                        completed.append(value)
+        return completed
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of text.
+
+        Args:
+            chunk (str): The text chunk.
+
+        Returns:
+            list: The values completed by this chunk, parsed.
+        """
+        completed = self._scan(chunk or '')
+        self.values.extend(completed)
+        return completed
+
+    def finish(self):
+        """
+        End the text. A value still open (e.g. an unmatched bracket in the prose) is rescanned
+        from after its opening bracket for complete values inside it.
+
+        Returns:
+            list: The values found by rescanning, parsed.
+        """
+        completed = []
+        while self.depth > 0:
+            rest = self.buffer[1:]
+            self._reset_value()
+            completed.extend(self._scan(rest))
+        self.values.extend(completed)
+        return completed
+
+    def first(self):
+        """
+        Get the first complete value found so far.
+
+        Returns:
+            dict or list or None: The value, None if none was found.
+        """
+        return self.values[0] if self.values else None
+
+def remove_trailing_commas(json_string):
+    """
+    Remove commas directly before a closing brace or bracket, leaving string contents untouched.
+    """
+    result = []
+    in_string = False
+    escaped = False
+    pending_comma = None
+    for char in json_string:
+        if in_string:
+            result.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if char.isspace():
+                pending_comma.append(char)
+                continue
+            if char not in '}]':
+                result.extend(pending_comma)
+            else:
+                # Keep the whitespace, drop the comma
+                result.extend(pending_comma[1:])
+            pending_comma = None
+        if char == ',':
+            pending_comma = [char]
+            continue
+        if char == '"':
+            in_string = True
+        result.append(char)
+    if pending_comma is not None:
+        result.extend(pending_comma)
+    return ''.join(result)
+
+def parse_json_value(json_string):
+    """
+    Parse a JSON value as written by an LLM, tolerating raw newlines in strings and trailing commas.
+
+    Args:
+        json_string (str): The JSON text.
+
+    Returns:
+        dict or list or None: The parsed value, None if it is not valid JSON.
+    """
+    try:
+        return json.loads(json_string, strict=False)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(remove_trailing_commas(json_string), strict=False)
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON: {e}")
+        return None
+
+def extract_json_value(input_string, kinds='{['):
+    """
+    Get the first complete top-level JSON object or array in a text, or the first one nested in a top-level value of the other kind.
+
+    Args:
+        input_string (str): The text, e.g. an LLM response with prose or code fences around the JSON.
+        kinds (str): The opening characters of the values to look for, '{' and/or '['.
+
+    Returns:
+        dict or list or None: The first value that parses, None if there is none.
+    """
+    scanner = JSONScanner(kinds)
+    scanner.feed(input_string)
+    if scanner.first() is None:
+        scanner.finish()
+    return scanner.first()
+
 def extract_dictionary_from_string(input_string):
     if input_string is None:
         print("Error: Input string is None.")
         return None
-    # Regular expression to find dictionary-like structure in the string
-    dict_pattern = re.compile(r'\{.*?\}', re.DOTALL)
-    
-    # Search for the dictionary-like structure
-    match = dict_pattern.search(input_string)
-    
-    if match:
-        dict_string = match.group(0)
-        
-        # Attempt parsing the string to JSON
-        dictionary = clean_and_parse_json(dict_string)
-        return dictionary
-    else:
+
+    dictionary = extract_json_value(input_string, kinds='{')
+    if not isinstance(dictionary, dict):
         print("Error: No dictionary-like structure found in the input string.")
         return None
+    return dictionary
 
-def clean_and_parse_json(input_string):
-    # Step 1: Clean input by removing newline characters and excessive whitespace
-    cleaned_string = re.sub(r'[\n\t]', '', input_string).strip()
-    
-    # Step 2: Convert single quotes to double quotes if needed
-    #cleaned_string = cleaned_string.replace("'", '"')
-    
-    # Step 3: Handle any trailing commas inside the dictionary
-    cleaned_string = re.sub(r',(\s*[\}\]])', r'\1', cleaned_string)
-    
-    # Step 4: Try to parse the cleaned string into a JSON object
-    try:
-        dictionary = json.loads(cleaned_string)
-        return dictionary
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON: {e}")
+def extract_list_from_string(input_string):
+    if input_string is None:
+        print("Error: Input string is None.")
         return None
 
+    # A list wrapped in an object (e.g. {"results": [...]}) is found as well
+    parsed = extract_json_value(input_string, kinds='[')
+    if not isinstance(parsed, list):
+        print("Error: No list-like structure found in the input string.")
+        return None
+    return parsed
+
+def clean_and_parse_json(input_string):
+    # Strip the whitespace and parse, tolerating raw newlines in strings and trailing commas
+    return parse_json_value(input_string.strip())
+
 def clean_text(text):
     """
     Normalize a string by removing all punctuation, whitespace, emojis,
@@ -260,4 +441,105 @@ def clean_text(text):
     # This handles: punctuation, emojis, symbols, whitespace, etc.
     cleaned = re.sub(r'[^a-zA-Z0-9]', '', text)
 
-    return cleaned.lower()
\ No newline at end of file
+    return cleaned.lower()
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Streaming HTML to text extractor.
+
+    Text is collected as the markup is tokenized, without building a tree. Content of
+    `skip_tags` is dropped, each remaining text node is stripped and the non-empty ones
+    are joined with spaces, the same as BeautifulSoup's get_text(separator=' ', strip=True)
+    after decomposing those tags.
+    """
+
+    VOID_TAGS = frozenset((
+        'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+        'link', 'meta', 'param', 'source', 'track', 'wbr',
+    ))
+
+    def __init__(self, skip_tags=('i', 'em', 'script', 'style')):
+        super().__init__(convert_charrefs=True)
+        self.skip_tags = frozenset(skip_tags)
+        self.parts = []
+        self._buffer = []
+        self._open_tags = []
+        self._skip_depth = 0
+
+    def _flush(self):
+        if self._buffer:
+            text = ''.join(self._buffer).strip()
+            if text:
+                self.parts.append(text)
+            self._buffer = []
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._buffer.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in self.VOID_TAGS:
+            return
+        self._open_tags.append(tag)
+        if tag in self.skip_tags:
+            self._skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag not in self._open_tags:
+            # Stray end tags are ignored
+            return
+        # Close everything opened after the matching start tag as well
+        while self._open_tags:
+            open_tag = self._open_tags.pop()
+            if open_tag in self.skip_tags:
+                self._skip_depth -= 1
+            if open_tag == tag:
+                break
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.startswith('CDATA[') and not self._skip_depth:
+            self._buffer.append(data[len('CDATA['):])
+            self._flush()
+
+    def get_text(self, separator=' '):
+        self._flush()
+        return separator.join(self.parts)
+
+
+def strip_html(html_text, skip_tags=('i', 'em', 'script', 'style')):
+    """
+    Convert an HTML snippet to plain text, dropping the content of `skip_tags`.
+
+    Args:
+        html_text (str): The HTML snippet.
+        skip_tags (tuple): Tags whose entire content is removed.
+
+    Returns:
+        str: The text, with text nodes stripped and joined by spaces.
+    """
+    if not html_text:
+        return ""
+    # No markup and no character references, nothing to parse
+    if '<' not in html_text and '&' not in html_text:
+        return html_text.strip()
+
+    extractor = HTMLTextExtractor(skip_tags=skip_tags)
+    extractor.feed(html_text)
+    extractor.close()
+    return extractor.get_text()